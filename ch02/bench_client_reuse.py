@@ -0,0 +1,126 @@
+"""Latency saved by reusing one pooled client, against a local mock API.
+
+Runs ``--calls`` generations two ways against ``MockAnthropicServer``:
+
+- ``fresh``: a new ``Anthropic()`` per call, as the listings did
+- ``shared``: Listing 2.5's ``generate_pr_description`` through
+  ``pr_client``'s shared client
+
+and reports per-call latency and TCP connections opened. The mock
+speaks plain HTTP on localhost, so the saving shown is client
+construction plus TCP setup; against the real API each new connection
+also pays a TLS handshake over the network. Usage:
+
+    python bench_client_reuse.py --calls 200
+"""
+
+import argparse
+import statistics
+import time
+
+from anthropic import Anthropic
+
+import pr_client
+from listing_2_5_complete import (
+    SYSTEM_PROMPT,
+    build_prompt,
+    generate_pr_description,
+)
+from mock_anthropic import MockAnthropicServer
+
+DIFF = """diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1 +1,2 @@
+ print("hello")
++print("world")
+"""
+
+
+def _fresh_call(url: str) -> None:
+    client = Anthropic(api_key="mock", base_url=url)
+    client.messages.create(
+        model="claude-sonnet-4",
+        max_tokens=1024,
+        system=SYSTEM_PROMPT,
+        messages=[
+            {"role": "user", "content": build_prompt(DIFF)}
+        ],
+    )
+    client.close()
+
+
+def _measure(call, calls: int) -> list[float]:
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _summary(latencies: list[float], connections: int) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(statistics.fmean(ordered) * 1e3, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1e3, 3),
+        "p99_ms": round(
+            ordered[int(len(ordered) * 0.99)] * 1e3, 3
+        ),
+        "connections": connections,
+    }
+
+
+def run(calls: int) -> dict:
+    results = {}
+    with MockAnthropicServer() as server:
+        latencies = _measure(
+            lambda: _fresh_call(server.url), calls
+        )
+        results["fresh"] = _summary(
+            latencies, server.connections
+        )
+
+    with MockAnthropicServer() as server:
+        pr_client.configure_client(
+            api_key="mock", base_url=server.url
+        )
+        try:
+            # Warm up the pool
+            generate_pr_description(DIFF)
+            opened = server.connections
+            latencies = _measure(
+                lambda: generate_pr_description(DIFF), calls
+            )
+            results["shared"] = _summary(
+                latencies, server.connections - opened
+            )
+        finally:
+            pr_client.close_client()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    results = run(args.calls)
+    print(
+        f"{'mode':<8} {'mean ms':>9} {'p50 ms':>9} "
+        f"{'p99 ms':>9} {'conns':>6}"
+    )
+    for mode, r in results.items():
+        print(
+            f"{mode:<8} {r['mean_ms']:>9} {r['p50_ms']:>9} "
+            f"{r['p99_ms']:>9} {r['connections']:>6}"
+        )
+    saved = results["fresh"]["mean_ms"] - results["shared"]["mean_ms"]
+    print(f"\nSaved {saved:.3f} ms per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Per-file diff chunking and map-reduce summaries for very large diffs.
+
+``build_prompt`` pastes the whole staged diff into one prompt. A large
+refactor can overflow the context window, and even when it fits,
+lockfile churn and generated code cost tokens and latency without
+telling the reviewer anything. ``generate_large_pr_description``:
+
+1. parses the diff into per-file sections and hunks (``parse_diff``),
+2. drops lockfiles, generated files and binary changes (``is_noise``),
+3. if what is left fits ``token_budget``, makes Listing 2.6's single
+   call on it,
+4. otherwise packs files into chunks of at most ``chunk_tokens``,
+   splitting large files on hunk boundaries, and summarizes the chunks
+   in parallel (map),
+5. then asks for the ``title/summary/tests/risks`` JSON from the chunk
+   notes in one call, validated against ``SCHEMA`` with Listing 2.6's
+   retry on invalid output (reduce). Notes that together exceed the
+   budget are summarized again in groups first, and cut to fit if a
+   single note is still too long.
+
+Token counts are estimated at ``CHARS_PER_TOKEN`` characters per token,
+which is close enough for budgeting and needs no API call.
+"""
+
+import fnmatch
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from anthropic import Anthropic
+
+from listing_2_4_validation import SYSTEM_PROMPT, build_prompt
+from pr_client import get_client
+from pr_retry import RETRYABLE, parse_response, retry_or_raise
+
+MODEL = "claude-sonnet-4"
+CHARS_PER_TOKEN = 4
+TOKEN_BUDGET = 30_000
+CHUNK_TOKENS = 6_000
+NOTE_TOKENS = 400
+# max_tokens caps real tokens, not the
+# estimate, so notes are cut to this too
+NOTE_CHARS = (NOTE_TOKENS - 1) * CHARS_PER_TOKEN
+MAX_WORKERS = 8
+
+LOCKFILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock",
+    "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock", "uv.lock",
+    "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock",
+}
+GENERATED_PATTERNS = (
+    "*.min.js", "*.min.css", "*.map", "*_pb2.py", "*_pb2_grpc.py",
+    "*.pb.go", "*.generated.*", "dist/*", "build/*", "vendor/*",
+    "node_modules/*", "*/dist/*", "*/vendor/*", "*/node_modules/*",
+)
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "auto-generated")
+# Generators put their marker in the first
+# lines of the file
+MARKER_LINES = 5
+
+NOTE_SYSTEM_PROMPT = """You are a senior software engineer reviewing one
+part of a large pull request. Reply with short plain-text notes only."""
+
+_FILE_START = re.compile(r"^diff --git ", re.M)
+_HUNK_START = re.compile(r"^@@ ", re.M)
+_PATH = re.compile(r"^diff --git a/(.+?) b/(.+)$", re.M)
+_FILE_TOP = re.compile(r"^@@ -\d+(?:,\d+)? \+1(?:,\d+)? @@")
+
+
+@dataclass
+class FileDiff:
+    """One file's section of a diff: its
+    header lines and its hunks."""
+
+    path: str
+    header: str
+    hunks: list[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return self.header + "".join(self.hunks)
+
+    @property
+    def binary(self) -> bool:
+        return (
+            "\nBinary files " in self.header
+            or "GIT binary patch" in self.header
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def parse_diff(diff: str) -> list[FileDiff]:
+    """Split ``git diff`` output into
+    ``FileDiff`` sections."""
+    starts = [m.start() for m in _FILE_START.finditer(diff)]
+    files = []
+    for start, end in zip(starts, starts[1:] + [len(diff)]):
+        section = diff[start:end]
+        match = _PATH.match(section)
+        path = match.group(2) if match else section.split("\n")[0]
+        hunk_starts = [
+            m.start() for m in _HUNK_START.finditer(section)
+        ]
+        if not hunk_starts:
+            files.append(FileDiff(path, section))
+            continue
+        bounds = hunk_starts + [len(section)]
+        files.append(FileDiff(
+            path,
+            section[:hunk_starts[0]],
+            [section[a:b] for a, b in zip(bounds, bounds[1:])],
+        ))
+    return files
+
+
+def is_noise(file: FileDiff) -> bool:
+    """Lockfiles, generated files and binary
+    changes."""
+    name = file.path.rsplit("/", 1)[-1]
+    if name in LOCKFILES or file.binary:
+        return True
+    if any(
+        fnmatch.fnmatch(file.path, pattern)
+        for pattern in GENERATED_PATTERNS
+    ):
+        return True
+    return _has_marker(file)
+
+
+def _has_marker(file: FileDiff) -> bool:
+    """A generated-file marker among the new
+    file's first ``MARKER_LINES`` lines."""
+    if not file.hunks or not _FILE_TOP.match(file.hunks[0]):
+        return False
+    top = [
+        line[1:]
+        for line in file.hunks[0].split("\n")[1:]
+        if line[:1] in ("+", " ")
+    ][:MARKER_LINES]
+    return any(
+        marker in line
+        for line in top
+        for marker in GENERATED_MARKERS
+    )
+
+
+def split_noise(
+    files: list[FileDiff],
+) -> tuple[list[FileDiff], list[str]]:
+    """Kept files and the paths of dropped
+    ones."""
+    kept, dropped = [], []
+    for file in files:
+        if is_noise(file):
+            dropped.append(file.path)
+        else:
+            kept.append(file)
+    return kept, dropped
+
+
+def _file_pieces(file: FileDiff, chunk_tokens: int) -> list[str]:
+    """``file`` as one or more texts of at
+    most ``chunk_tokens``, split on hunks;
+    each piece repeats the header."""
+    if estimate_tokens(file.text) <= chunk_tokens:
+        return [file.text]
+    limit = (chunk_tokens - 1) * CHARS_PER_TOKEN
+    header = file.header[:limit // 2]
+    room = limit - len(header)
+    pieces, current = [], ""
+    for hunk in file.hunks:
+        if len(hunk) > room:
+            hunk = hunk[:room - 20] + "\n[hunk truncated]\n"
+        if current and len(current) + len(hunk) > room:
+            pieces.append(header + current)
+            current = ""
+        current += hunk
+    if current or not pieces:
+        pieces.append(header + current)
+    return pieces
+
+
+def chunk_files(
+    files: list[FileDiff], chunk_tokens: int = CHUNK_TOKENS
+) -> list[str]:
+    """Pack whole files, or hunk-split parts
+    of large ones, into chunks of at most
+    ``chunk_tokens``."""
+    chunks, current, used = [], [], 0
+    for file in files:
+        for piece in _file_pieces(file, chunk_tokens):
+            size = estimate_tokens(piece)
+            if current and used + size > chunk_tokens:
+                chunks.append("".join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += size
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _note_prompt(text: str, kind: str) -> str:
+    return f"""Summarize these {kind} for a pull request description.
+
+Write up to 6 short bullet notes covering:
+- what changed and why it matters
+- tests added or changed, only if present
+- risks: behavior changes, migrations, removed code
+
+{kind.capitalize()}:
+{text}"""
+
+
+def _note(
+    client: Anthropic, text: str, kind: str, model: str
+) -> str:
+    message = client.messages.create(
+        model=model,
+        max_tokens=NOTE_TOKENS,
+        system=NOTE_SYSTEM_PROMPT,
+        messages=[
+            {"role": "user",
+             "content": _note_prompt(text, kind)}
+        ]
+    )
+    return message.content[0].text[:NOTE_CHARS]
+
+
+# Prompt text around a chunk or group of
+# notes in a map call
+NOTE_OVERHEAD = max(
+    estimate_tokens(_note_prompt("", kind))
+    for kind in ("diff chunks", "review notes")
+)
+
+
+def _map(
+    client: Anthropic,
+    texts: list[str],
+    kind: str,
+    model: str,
+    max_workers: int,
+) -> list[str]:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(
+            lambda text: _note(client, text, kind, model), texts
+        ))
+
+
+def build_reduce_prompt(notes: list[str], dropped: list[str]) -> str:
+    """Contract prompt over chunk notes
+    instead of the raw diff."""
+    sections = "\n\n".join(
+        f"Part {i}:\n{note}" for i, note in enumerate(notes, 1)
+    )
+    skipped = ", ".join(dropped) or "none"
+    return build_prompt(
+        f"(Too large to include; notes on each part follow.)\n\n"
+        f"{sections}\n\n"
+        f"Lockfiles, generated and binary files omitted: {skipped}"
+    )
+
+
+def _fit_notes(
+    notes: list[str], dropped: list[str], token_budget: int
+) -> list[str]:
+    """``notes`` cut evenly so that the
+    reduce prompt fits ``token_budget``."""
+    if estimate_tokens(
+        build_reduce_prompt(notes, dropped)
+    ) <= token_budget:
+        return notes
+    fixed = len(build_reduce_prompt([""] * len(notes), dropped))
+    each = (
+        (token_budget - 1) * CHARS_PER_TOKEN - fixed
+    ) // len(notes)
+    if each < 1:
+        raise ValueError(
+            "token_budget is too small for the reduce prompt"
+        )
+    return [note[:each] for note in notes]
+
+
+def _generate_json(
+    client: Anthropic, prompt: str, model: str, max_retries: int
+) -> dict:
+    """Listing 2.6's retry loop for an
+    arbitrary prompt."""
+    messages = [{"role": "user", "content": prompt}]
+    for attempt in range(max_retries + 1):
+        response = client.messages.create(
+            model=model,
+            max_tokens=1024,
+            system=SYSTEM_PROMPT,
+            messages=messages
+        )
+        response_text = response.content[0].text
+        try:
+            return parse_response(response_text)
+        except RETRYABLE as e:
+            retry_or_raise(
+                messages, response_text, e, attempt, max_retries
+            )
+    raise ValueError("No attempts made")
+
+
+def generate_large_pr_description(
+    diff: str,
+    token_budget: int = TOKEN_BUDGET,
+    chunk_tokens: int = CHUNK_TOKENS,
+    max_workers: int = MAX_WORKERS,
+    client: Anthropic | None = None,
+    model: str = MODEL,
+    max_retries: int = 2,
+) -> dict:
+    """PR description for a diff of any
+    size; prompts stay within
+    ``token_budget`` estimated tokens.
+
+    ``chunk_tokens`` must be at least
+    ``NOTE_TOKENS`` and leave room for the
+    note prompt, and ``token_budget`` must
+    fit two notes in one prompt.
+    """
+    note_room = token_budget - NOTE_OVERHEAD
+    if not NOTE_TOKENS <= chunk_tokens <= note_room:
+        raise ValueError(
+            f"chunk_tokens must be between {NOTE_TOKENS} "
+            f"and token_budget - {NOTE_OVERHEAD}"
+        )
+    if note_room < 2 * NOTE_TOKENS:
+        raise ValueError(
+            f"token_budget must be at least "
+            f"{2 * NOTE_TOKENS + NOTE_OVERHEAD}"
+        )
+    client = client or get_client()
+    kept, dropped = split_noise(parse_diff(diff))
+    if not kept:
+        raise ValueError("Only lockfile, generated or binary changes.")
+
+    filtered = "".join(file.text for file in kept)
+    if estimate_tokens(build_prompt(filtered)) <= token_budget:
+        return _generate_json(
+            client, build_prompt(filtered), model, max_retries
+        )
+
+    notes = _map(
+        client, chunk_files(kept, chunk_tokens), "diff chunks",
+        model, max_workers,
+    )
+    while (
+        len(notes) > 1
+        and estimate_tokens(build_reduce_prompt(notes, dropped))
+        > token_budget
+    ):
+        # Each group holds at least two notes,
+        # so every round shrinks the list
+        groups = chunk_files(
+            [FileDiff("notes", "", [n + "\n\n"]) for n in notes],
+            note_room,
+        )
+        notes = _map(client, groups, "review notes", model,
+                     max_workers)
+    notes = _fit_notes(notes, dropped, token_budget)
+    return _generate_json(
+        client, build_reduce_prompt(notes, dropped), model,
+        max_retries,
+    )
+
+
+if __name__ == "__main__":
+    from listing_2_5_complete import format_for_github, get_git_diff
+
+    diff = get_git_diff()
+    if not diff:
+        print("No staged changes found.")
+    else:
+        try:
+            pr = generate_large_pr_description(diff)
+            print(format_for_github(pr))
+        except ValueError as e:
+            print(f"Error: {e}")
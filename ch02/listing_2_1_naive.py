@@ -1,7 +1,8 @@
 """Listing 2.1: Naive PR generator -- no contract, no validation."""
 
 import subprocess
-from anthropic import Anthropic
+
+from pr_client import get_client
 
 
 def get_git_diff() -> str:
@@ -16,7 +17,7 @@ def get_git_diff() -> str:
 
 def generate_pr_description(diff: str) -> str:
     """Generate a PR description using AI."""
-    client = Anthropic()
+    client = get_client()
 
     message = client.messages.create(
         model="claude-sonnet-4",
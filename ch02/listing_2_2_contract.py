@@ -1,6 +1,6 @@
 """Listing 2.2: PR generator with system prompt and contract."""
 
-from anthropic import Anthropic
+from pr_client import get_client
 
 
 SYSTEM_PROMPT = """You are a senior software engineer writing pull request
@@ -10,7 +10,7 @@ understand exactly what changed and why. You always assess risks honestly."""
 
 def generate_pr_description(diff: str) -> str:
     """Generate a structured PR description."""
-    client = Anthropic()
+    client = get_client()
 
     prompt = f"""Analyze the following git diff and produce a PR description
 with these exact sections:
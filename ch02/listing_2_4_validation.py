@@ -2,9 +2,9 @@
 
 import json
 from jsonschema import validate, ValidationError
-from anthropic import Anthropic
 
 from listing_2_3_schema import SCHEMA
+from pr_client import get_client
 
 
 SYSTEM_PROMPT = """You are a senior software engineer writing pull request
@@ -36,7 +36,7 @@ Diff:
 
 def generate_pr_description(diff: str) -> dict:
     """Generate and validate PR description."""
-    client = Anthropic()
+    client = get_client()
 
     message = client.messages.create(
         model="claude-sonnet-4",
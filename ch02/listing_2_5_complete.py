@@ -3,7 +3,8 @@
 import subprocess
 import json
 from jsonschema import validate, ValidationError
-from anthropic import Anthropic
+
+from pr_client import get_client
 
 
 SCHEMA = {
@@ -69,7 +70,7 @@ Diff:
 
 def generate_pr_description(diff: str) -> dict:
     """Generate and validate PR description."""
-    client = Anthropic()
+    client = get_client()
 
     message = client.messages.create(
         model="claude-sonnet-4",
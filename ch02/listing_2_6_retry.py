@@ -2,17 +2,17 @@
 
 import json
 from jsonschema import validate, ValidationError
-from anthropic import Anthropic
 
 from listing_2_3_schema import SCHEMA
 from listing_2_4_validation import SYSTEM_PROMPT, build_prompt
+from pr_client import get_client
 
 
 def generate_with_retry(diff: str,
                         max_retries: int = 2
                         ) -> dict:
     """Generate PR description with retry on validation failure."""
-    client = Anthropic()
+    client = get_client()
     messages = [
         {"role": "user",
          "content": build_prompt(diff)}
@@ -0,0 +1,190 @@
+"""Local stand-in for the Anthropic Messages API.
+
+``MockAnthropicServer`` answers ``POST /v1/messages`` on a local port
+with a canned assistant message, so the PR generators can be
+benchmarked and tested without network access or an API key. Point a
+client at it with ``base_url=server.url``. It counts TCP connections,
+which shows whether clients reuse them. Requests with ``"stream": true``
+get the reply as server-sent events, ``stream_chunk`` characters per
+text delta.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+PR_JSON = json.dumps({
+    "title": "Add retry to PR generator",
+    "summary": ["Adds retry loop", "Feeds errors back"],
+    "tests": ["Valid JSON first try", "Invalid JSON retried"],
+    "risks": ["Extra API cost", "Longer latency"],
+})
+
+
+def message_body(text: str, model: str) -> dict:
+    """Messages API response carrying
+    ``text``."""
+    return {
+        "id": "msg_mock",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 1, "output_tokens": 1},
+    }
+
+
+def stream_events(text: str, model: str, chunk: int):
+    """Messages API stream events for
+    ``text``, ``chunk`` characters per
+    delta."""
+    start = message_body("", model)
+    start["content"] = []
+    yield "message_start", {"type": "message_start", "message": start}
+    yield "content_block_start", {
+        "type": "content_block_start",
+        "index": 0,
+        "content_block": {"type": "text", "text": ""},
+    }
+    for i in range(0, len(text), chunk):
+        yield "content_block_delta", {
+            "type": "content_block_delta",
+            "index": 0,
+            "delta": {"type": "text_delta", "text": text[i:i + chunk]},
+        }
+    yield "content_block_stop", {
+        "type": "content_block_stop", "index": 0
+    }
+    yield "message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": 1},
+    }
+    yield "message_stop", {"type": "message_stop"}
+
+
+class MockAnthropicServer:
+    """Threaded HTTP/1.1 server with
+    keep-alive.
+
+    ``reply(request_json)`` returns the
+    assistant text; by default a valid PR
+    description. ``latency`` seconds are
+    added to every response, and
+    ``stream_delay`` between streamed
+    deltas.
+    """
+
+    def __init__(
+        self,
+        reply: Callable[[dict], str] | None = None,
+        latency: float = 0.0,
+        stream_chunk: int = 8,
+        stream_delay: float = 0.0,
+    ):
+        self.reply = reply or (lambda request: PR_JSON)
+        self.latency = latency
+        self.stream_chunk = stream_chunk
+        self.stream_delay = stream_delay
+        # Streams the client hung up on
+        self.aborted_streams = 0
+        self.connections = 0
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._handler()
+        )
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "MockAnthropicServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate
+            # sends; without TCP_NODELAY each
+            # keep-alive response would wait on
+            # the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                request = json.loads(self.rfile.read(length))
+                with server._lock:
+                    server.requests.append(request)
+                if server.latency:
+                    time.sleep(server.latency)
+                server.respond(self, request)
+
+        return Handler
+
+    def respond(self, handler, request: dict) -> None:
+        if request.get("stream"):
+            self.respond_stream(handler, request)
+            return
+        body = json.dumps(
+            message_body(
+                self.reply(request), request.get("model", "")
+            )
+        ).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def respond_stream(self, handler, request: dict) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        events = stream_events(
+            self.reply(request),
+            request.get("model", ""),
+            self.stream_chunk,
+        )
+        try:
+            for event, data in events:
+                payload = (
+                    f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                ).encode()
+                handler.wfile.write(
+                    f"{len(payload):x}\r\n".encode()
+                    + payload + b"\r\n"
+                )
+                handler.wfile.flush()
+                if event == "content_block_delta":
+                    time.sleep(self.stream_delay)
+            handler.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with self._lock:
+                self.aborted_streams += 1
+            handler.close_connection = True
@@ -0,0 +1,262 @@
+"""Concurrent PR description generation for many diffs or repositories.
+
+The listings handle one diff at a time, so a nightly run over thousands
+of open branches is a sequential loop of model calls. ``generate_batch``
+runs Listing 2.6's steps (``build_prompt``, model call, ``json.loads``,
+``SCHEMA`` validation, conversational retry) for many inputs at once on
+one ``AsyncAnthropic`` client:
+
+- at most ``concurrency`` generations are in flight,
+- model calls are spaced to stay under ``requests_per_minute``,
+- results are yielded as they finish, not in input order, and inputs
+  are read lazily, so memory stays flat for any batch size.
+
+Each input is a diff or the path of a repository, whose
+``git diff --staged`` is used. Failures come back as results with
+``error`` set instead of stopping the batch. Usage:
+
+    python pr_batch.py repo_a repo_b ... --concurrency 16 --rpm 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable
+
+from anthropic import AsyncAnthropic
+
+from listing_2_3_schema import SCHEMA
+from listing_2_4_validation import SYSTEM_PROMPT, build_prompt
+from pr_cache import PRCache, cache_key
+from pr_client import make_async_client
+from pr_retry import RETRYABLE, parse_response, retry_or_raise
+
+MODEL = "claude-sonnet-4"
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 50
+
+
+@dataclass
+class BatchResult:
+    """Outcome for one input."""
+
+    index: int
+    source: str
+    description: dict | None = None
+    error: str | None = None
+    attempts: int = 0
+    cached: bool = False
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.description is not None
+
+
+class RequestPacer:
+    """Spaces calls at least ``60 /
+    requests_per_minute`` seconds apart."""
+
+    def __init__(self, requests_per_minute: float):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.interval = 60.0 / requests_per_minute
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def read_staged_diff(repo: str) -> str:
+    """``git diff --staged`` run in
+    ``repo``."""
+    proc = await asyncio.create_subprocess_exec(
+        "git", "diff", "--staged",
+        cwd=repo,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode:
+        raise ValueError(f"git diff failed: {err.decode().strip()}")
+    return out.decode()
+
+
+async def generate_async(
+    client: AsyncAnthropic,
+    diff: str,
+    pacer: RequestPacer | None = None,
+    max_retries: int = 2,
+    model: str = MODEL,
+) -> tuple[dict, int]:
+    """Listing 2.6's ``generate_with_retry``
+    on an async client; returns the
+    description and the attempts used."""
+    messages = [
+        {"role": "user",
+         "content": build_prompt(diff)}
+    ]
+
+    for attempt in range(max_retries + 1):
+        if pacer is not None:
+            await pacer.wait()
+        response = await client.messages.create(
+            model=model,
+            max_tokens=1024,
+            system=SYSTEM_PROMPT,
+            messages=messages
+        )
+
+        response_text = response.content[0].text
+
+        try:
+            return parse_response(response_text), attempt + 1
+        except RETRYABLE as e:
+            retry_or_raise(
+                messages, response_text, e, attempt, max_retries
+            )
+
+    raise ValueError("No attempts made")
+
+
+async def _generate_one(
+    index: int,
+    item: str,
+    client: AsyncAnthropic,
+    pacer: RequestPacer,
+    max_retries: int,
+    model: str,
+    cache: PRCache | None,
+) -> BatchResult:
+    is_repo = os.path.isdir(item)
+    result = BatchResult(index, item if is_repo else f"diff #{index}")
+    start = time.perf_counter()
+    try:
+        diff = await read_staged_diff(item) if is_repo else item
+        if not diff.strip():
+            raise ValueError("No staged changes found.")
+        if cache is not None:
+            key = cache_key(diff, build_prompt, model, SCHEMA)
+            result.description = cache.get(key)
+            result.cached = result.description is not None
+        if result.description is None:
+            result.description, result.attempts = (
+                await generate_async(
+                    client, diff, pacer, max_retries, model
+                )
+            )
+            if cache is not None:
+                cache.put(key, result.description, SCHEMA)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def generate_batch(
+    items: Iterable[str],
+    concurrency: int = CONCURRENCY,
+    requests_per_minute: float = REQUESTS_PER_MINUTE,
+    client: AsyncAnthropic | None = None,
+    max_retries: int = 2,
+    model: str = MODEL,
+    cache: PRCache | None = None,
+) -> AsyncIterator[BatchResult]:
+    """Yield a ``BatchResult`` per diff or
+    repository path in ``items`` as each
+    finishes.
+
+    Without ``client`` one is made for the
+    batch, sized to ``concurrency``, and
+    closed at the end.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    own_client = client is None
+    if own_client:
+        client = make_async_client(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+        )
+    pacer = RequestPacer(requests_per_minute)
+    feed = enumerate(items)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        for index, item in feed:
+            await results.put(await _generate_one(
+                index, item, client, pacer,
+                max_retries, model, cache,
+            ))
+
+    async def run():
+        try:
+            await asyncio.gather(
+                *(worker() for _ in range(concurrency))
+            )
+        finally:
+            await results.put(None)
+
+    runner = asyncio.create_task(run())
+    try:
+        while (result := await results.get()) is not None:
+            yield result
+        await runner
+    finally:
+        runner.cancel()
+        if own_client:
+            await client.close()
+
+
+async def _main(args) -> int:
+    cache = None if args.no_cache else PRCache()
+    failed = 0
+    with open(args.output, "w") as out:
+        async for r in generate_batch(
+            args.repos, args.concurrency, args.rpm, cache=cache
+        ):
+            failed += not r.ok
+            out.write(json.dumps({
+                "source": r.source,
+                "description": r.description,
+                "error": r.error,
+                "cached": r.cached,
+            }) + "\n")
+            status = "cached" if r.cached else (
+                "ok" if r.ok else r.error
+            )
+            print(f"{r.source}: {status} ({r.elapsed:.1f}s)")
+    print(f"(results saved to {args.output})")
+    return failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("repos", nargs="+")
+    parser.add_argument(
+        "--concurrency", type=int, default=CONCURRENCY
+    )
+    parser.add_argument(
+        "--rpm", type=float, default=REQUESTS_PER_MINUTE
+    )
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default="pr_descriptions.jsonl")
+    args = parser.parse_args()
+    failed = asyncio.run(_main(args))
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
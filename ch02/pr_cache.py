@@ -0,0 +1,262 @@
+"""Persistent cache of validated PR descriptions, keyed by content.
+
+CI re-runs and rebases that leave the change itself alone send the same
+diff again, and each run pays for the same model call. ``cache_pr``
+wraps a generator such as ``generate_pr_description`` or
+``generate_with_retry`` so that a repeat diff is answered from a local
+SQLite file without touching the network.
+
+The key is the SHA-256 of everything that shapes the answer: the
+normalized diff, the prompt ``build_prompt`` makes from it, the model
+name and the ``SCHEMA``. Changing the prompt template, the model or
+the schema therefore misses the cache instead of serving stale output.
+Only results that pass ``SCHEMA`` are stored; failures are never
+cached. Entries expire after ``ttl`` seconds, and past ``max_entries``
+the least recently used are evicted.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from jsonschema import validate
+
+CACHE_PATH = os.environ.get(
+    "PR_CACHE_PATH",
+    os.path.expanduser("~/.cache/pr_descriptions.sqlite3"),
+)
+MODEL = "claude-sonnet-4"
+TTL = 7 * 24 * 3600.0
+MAX_ENTRIES = 10_000
+
+# Blob ids change with unrelated history;
+# the content below them does not
+_INDEX_LINE = re.compile(r"^index [0-9a-f]+\.\.[0-9a-f]+.*\n", re.M)
+
+
+def normalize_diff(diff: str) -> str:
+    """``diff`` with line endings and
+    ``index`` lines made uniform.
+
+    Whitespace inside lines is kept: a
+    whitespace-only change is still a
+    change.
+    """
+    diff = diff.replace("\r\n", "\n")
+    diff = _INDEX_LINE.sub("", diff)
+    return diff.strip("\n") + "\n"
+
+
+def cache_key(
+    diff: str,
+    build_prompt: Callable[[str], str],
+    model: str,
+    schema: dict,
+) -> str:
+    """SHA-256 over the normalized diff, its
+    prompt, the model and the schema."""
+    diff = normalize_diff(diff)
+    material = json.dumps(
+        {
+            "diff": diff,
+            "prompt": build_prompt(diff),
+            "model": model,
+            "schema": schema,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class PRCache:
+    """SQLite store of ``key -> description``
+    with TTL and LRU eviction.
+
+    Safe to share between threads; the file
+    can be shared between processes.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: float = TTL,
+        max_entries: int = MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if path != ":memory:":
+            os.makedirs(
+                os.path.dirname(os.path.abspath(path)),
+                exist_ok=True,
+            )
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS descriptions_accessed"
+            " ON descriptions (accessed)"
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM descriptions"
+            ).fetchone()
+        return count
+
+    def get(self, key: str) -> dict | None:
+        """The stored description, or None if
+        missing or expired."""
+        now = self.clock()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM descriptions"
+                " WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if now - created >= self.ttl:
+                self._db.execute(
+                    "DELETE FROM descriptions WHERE key = ?",
+                    (key,),
+                )
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE descriptions SET accessed = ?"
+                " WHERE key = ?",
+                (now, key),
+            )
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, value: dict, schema: dict) -> None:
+        """Store ``value`` if it matches
+        ``schema``; raises ``ValidationError``
+        otherwise."""
+        validate(instance=value, schema=schema)
+        now = self.clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO descriptions"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute(
+            "DELETE FROM descriptions WHERE created <= ?",
+            (now - self.ttl,),
+        )
+        self._db.execute(
+            "DELETE FROM descriptions WHERE key IN ("
+            " SELECT key FROM descriptions"
+            " ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM descriptions")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_cache: PRCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> PRCache:
+    """The default cache at ``CACHE_PATH``,
+    opened on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PRCache()
+    return _cache
+
+
+def cache_pr(
+    generate: Callable[..., dict],
+    build_prompt: Callable[[str], str],
+    schema: dict,
+    model: str = MODEL,
+    cache: PRCache | None = None,
+) -> Callable[..., dict]:
+    """Wrap ``generate(diff, ...)`` so repeat
+    diffs are served from ``cache``.
+
+    ``build_prompt``, ``schema`` and
+    ``model`` must be the ones ``generate``
+    uses, since they form part of the key.
+    """
+
+    @functools.wraps(generate)
+    def wrapper(diff: str, *args, **kwargs) -> dict:
+        store = cache if cache is not None else get_cache()
+        key = cache_key(diff, build_prompt, model, schema)
+        cached = store.get(key)
+        if cached is not None:
+            return cached
+        result = generate(diff, *args, **kwargs)
+        store.put(key, result, schema)
+        return result
+
+    wrapper.cache_key = lambda diff: cache_key(
+        diff, build_prompt, model, schema
+    )
+    return wrapper
+
+
+if __name__ == "__main__":
+    from listing_2_5_complete import (
+        SCHEMA,
+        build_prompt,
+        format_for_github,
+        generate_pr_description,
+        get_git_diff,
+    )
+
+    generate = cache_pr(generate_pr_description, build_prompt, SCHEMA)
+    diff = get_git_diff()
+    if not diff:
+        print("No staged changes found.")
+    else:
+        try:
+            start = time.perf_counter()
+            pr = generate(diff)
+            elapsed = (time.perf_counter() - start) * 1e3
+            print(format_for_github(pr))
+            source = "cache" if get_cache().hits else "model"
+            print(f"\n({source}, {elapsed:.1f} ms)")
+        except ValueError as e:
+            print(f"Error: {e}")
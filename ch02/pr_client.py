@@ -0,0 +1,115 @@
+"""Shared Anthropic client with a pooled, keep-alive HTTP connection.
+
+The listings build ``Anthropic()`` inside every call, so each PR
+description pays for client construction and a new connection pool,
+which means a fresh TCP and TLS handshake. Run as a service over many
+repos, that overhead repeats on every call. ``get_client()`` returns
+one long-lived client per process. Its pool keeps connections open
+between calls, up to configurable limits.
+
+Call ``configure_client(...)`` once at startup to change the pool
+limits, timeouts or ``base_url``; later ``get_client()`` calls return
+the new client. ``make_async_client()`` builds the ``AsyncAnthropic``
+equivalent. Its pool is tied to one event loop, so async code makes one
+per run and shares it across that run's requests.
+"""
+
+import threading
+
+import httpx
+from anthropic import (
+    Anthropic,
+    AsyncAnthropic,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    Timeout,
+)
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 60.0
+TIMEOUT = Timeout(120.0, connect=10.0)
+
+_client: Anthropic | None = None
+_lock = threading.Lock()
+
+
+def make_client(
+    max_connections: int = MAX_CONNECTIONS,
+    max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = KEEPALIVE_EXPIRY,
+    timeout: Timeout | float = TIMEOUT,
+    **kwargs,
+) -> Anthropic:
+    """New ``Anthropic`` client with its own
+    connection pool.
+
+    Extra keyword arguments (``api_key``,
+    ``base_url``, ``max_retries``...) go to
+    ``Anthropic``.
+    """
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+    )
+    return Anthropic(
+        http_client=http_client, timeout=timeout, **kwargs
+    )
+
+
+def make_async_client(
+    max_connections: int = MAX_CONNECTIONS,
+    max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = KEEPALIVE_EXPIRY,
+    timeout: Timeout | float = TIMEOUT,
+    **kwargs,
+) -> AsyncAnthropic:
+    """``make_client`` for asyncio; close it
+    with ``await client.close()``."""
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+    )
+    return AsyncAnthropic(
+        http_client=http_client, timeout=timeout, **kwargs
+    )
+
+
+def get_client() -> Anthropic:
+    """The process-wide shared client,
+    created on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = make_client()
+    return _client
+
+
+def configure_client(**kwargs) -> Anthropic:
+    """Replace the shared client with one
+    built by ``make_client(**kwargs)``."""
+    global _client
+    with _lock:
+        old, _client = _client, make_client(**kwargs)
+    if old is not None:
+        old.close()
+    return _client
+
+
+def close_client() -> None:
+    """Close the shared client's
+    connections."""
+    global _client
+    with _lock:
+        old, _client = _client, None
+    if old is not None:
+        old.close()
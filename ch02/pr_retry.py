@@ -0,0 +1,62 @@
+"""Listing 2.6's validate-and-feed-back step, shared by the extensions.
+
+Listing 2.6 parses each response, validates it against ``SCHEMA`` and,
+when that fails, appends the bad answer and the error to the
+conversation so the next attempt can fix it. The batch, chunking and
+streaming generators run the same step around their own (sync, async
+or streamed) model calls:
+
+    for attempt in range(max_retries + 1):
+        text = ...  # model call on messages
+        try:
+            return parse_response(text)
+        except RETRYABLE as e:
+            retry_or_raise(messages, text, e, attempt, max_retries)
+"""
+
+import json
+
+from jsonschema import validate, ValidationError
+
+from listing_2_3_schema import SCHEMA
+
+# Errors that another attempt may fix
+RETRYABLE = (json.JSONDecodeError, ValidationError)
+
+
+def parse_response(text: str, schema: dict = SCHEMA) -> dict:
+    """``json.loads`` then ``validate``
+    against ``schema``."""
+    data = json.loads(text)
+    validate(instance=data, schema=schema)
+    return data
+
+
+def retry_or_raise(
+    messages: list[dict],
+    text: str,
+    error: Exception,
+    attempt: int,
+    max_retries: int,
+) -> None:
+    """Append the invalid ``text`` and the
+    error to ``messages`` for the next
+    attempt, or raise ``ValueError`` after
+    the last one."""
+    if attempt >= max_retries:
+        raise ValueError(
+            f"Failed after "
+            f"{max_retries + 1} attempts: "
+            f"{error}"
+        )
+    messages.append({
+        "role": "assistant",
+        "content": text.rstrip() or "(empty)"
+    })
+    messages.append({
+        "role": "user",
+        "content": f"That JSON was "
+                   f"invalid: {error}. "
+                   f"Fix it to match "
+                   f"the schema."
+    })
@@ -0,0 +1,335 @@
+"""Streamed PR generation with incremental validation and early abort.
+
+``generate_pr_description`` and ``generate_with_retry`` wait for the
+whole response before ``json.loads`` and ``validate`` run, so an answer
+that went wrong in its first characters still costs a full generation
+before the retry starts. Here the response is streamed and each text
+delta is fed to ``StreamValidator``, which follows the JSON as it grows
+and checks it against ``SCHEMA``'s structure:
+
+- anything before the opening ``{`` (prose, a Markdown fence),
+- a key the schema does not allow,
+- a value of the wrong type, judged by its first character,
+- anything after the closing ``}``.
+
+On the first of these it raises ``StreamAbort`` and leaving the stream
+closes the HTTP response, so no more tokens are generated. Checks that
+need the whole object (required keys, ``minItems``) run on completion
+with ``validate`` as before.
+
+``StreamMetrics`` records, per attempt, the time to the first complete
+field, the total time, and whether and why the stream was aborted.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from anthropic import Anthropic
+
+from listing_2_3_schema import SCHEMA
+from listing_2_4_validation import SYSTEM_PROMPT, build_prompt
+from pr_client import get_client
+from pr_retry import RETRYABLE, parse_response, retry_or_raise
+
+MODEL = "claude-sonnet-4"
+
+_JSON_TYPES = {
+    '"': "string",
+    "[": "array",
+    "{": "object",
+    "t": "boolean",
+    "f": "boolean",
+    "n": "null",
+}
+
+
+class StreamAbort(ValueError):
+    """The partial output can no longer
+    become valid."""
+
+    def __init__(self, reason: str, partial: str):
+        super().__init__(reason)
+        self.partial = partial
+
+
+@dataclass
+class StreamMetrics:
+    """Timings for one streamed attempt, in
+    seconds from the request."""
+
+    time_to_first_field: float | None = None
+    elapsed: float = 0.0
+    characters: int = 0
+    fields: list[str] = field(default_factory=list)
+    aborted: str | None = None
+
+
+def _value_type(char: str) -> str:
+    return _JSON_TYPES.get(char, "number")
+
+
+def _type_allowed(char: str, spec: dict) -> bool:
+    expected = spec.get("type")
+    if expected is None:
+        return True
+    actual = _value_type(char)
+    allowed = expected if isinstance(expected, list) else [expected]
+    return actual in allowed or (
+        actual == "number" and "integer" in allowed
+    )
+
+
+class StreamValidator:
+    """Character-level follower of a JSON
+    object checked against an object
+    schema as it arrives."""
+
+    def __init__(
+        self,
+        schema: dict = SCHEMA,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.schema = schema
+        self.properties = schema.get("properties", {})
+        self.additional = schema.get("additionalProperties", True)
+        self.clock = clock
+        self.started = clock()
+        self.metrics = StreamMetrics()
+        self._parts: list[str] = []
+        self._state = "start"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: list[str] = []
+        self._field = ""
+        self._expect_item = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _abort(self, reason: str) -> None:
+        self.metrics.aborted = reason
+        self.metrics.elapsed = self.clock() - self.started
+        raise StreamAbort(reason, self.text)
+
+    def _field_done(self) -> None:
+        self.metrics.fields.append(self._field)
+        if self.metrics.time_to_first_field is None:
+            self.metrics.time_to_first_field = (
+                self.clock() - self.started
+            )
+
+    def _start_value(self, char: str) -> None:
+        spec = self.properties.get(self._field, {})
+        if not _type_allowed(char, spec):
+            self._abort(
+                f"{self._field!r} should be "
+                f"{spec['type']}, got {_value_type(char)}"
+            )
+        if char == '"':
+            self._in_string = True
+            self._state = "value"
+        elif char in "[{":
+            self._depth += 1
+            self._state = "nested"
+            self._expect_item = char == "["
+        else:
+            self._state = "scalar"
+
+    def _check_item(self, char: str) -> None:
+        items = self.properties.get(self._field, {}).get("items", {})
+        if char != "]" and not _type_allowed(char, items):
+            self._abort(
+                f"items of {self._field!r} should be "
+                f"{items['type']}, got {_value_type(char)}"
+            )
+        self._expect_item = False
+
+    def _end_string(self) -> None:
+        if self._depth != 1:
+            return
+        if self._state == "key":
+            self._field = "".join(self._key)
+            if (
+                self.additional is False
+                and self._field not in self.properties
+            ):
+                self._abort(f"unexpected key {self._field!r}")
+            self._state = "colon"
+        elif self._state == "value":
+            self._field_done()
+            self._state = "comma"
+
+    def _top_level(self, char: str) -> None:
+        state = self._state
+        if state == "key":
+            if char == '"':
+                self._in_string = True
+                self._key = []
+            elif char == "}" and not self.metrics.fields:
+                self._depth, self._state = 0, "done"
+            else:
+                self._abort(f"expected a key, got {char!r}")
+        elif state == "colon":
+            if char != ":":
+                self._abort(f"expected ':', got {char!r}")
+            self._state = "value_start"
+        elif state == "value_start":
+            self._start_value(char)
+        elif state in ("comma", "scalar"):
+            if state == "scalar" and char not in ",}":
+                return
+            if state == "scalar":
+                self._field_done()
+            if char == ",":
+                self._state = "key"
+            elif char == "}":
+                self._depth, self._state = 0, "done"
+            else:
+                self._abort(f"expected ',' or '}}', got {char!r}")
+
+    def _nested(self, char: str) -> None:
+        if self._expect_item and self._depth == 2:
+            self._check_item(char)
+        if char == '"':
+            self._in_string = True
+        elif char in "[{":
+            self._depth += 1
+        elif char in "]}":
+            self._depth -= 1
+            if self._depth == 1:
+                self._field_done()
+                self._state = "comma"
+        elif char == "," and self._depth == 2:
+            self._expect_item = True
+
+    def feed(self, chunk: str) -> None:
+        """Consume a text delta; raises
+        ``StreamAbort`` once the output is
+        clearly invalid."""
+        self._parts.append(chunk)
+        self.metrics.characters += len(chunk)
+        for char in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string()
+                    continue
+                if self._state == "key" and self._depth == 1:
+                    self._key.append(char)
+                continue
+            if char.isspace():
+                continue
+            if self._state == "start":
+                if char != "{":
+                    self._abort("text before the JSON object")
+                self._depth, self._state = 1, "key"
+            elif self._state == "done":
+                self._abort("text after the JSON object")
+            elif self._depth == 1:
+                self._top_level(char)
+            else:
+                self._nested(char)
+
+    def finish(self) -> dict:
+        """Parse and fully validate the
+        complete text."""
+        self.metrics.elapsed = self.clock() - self.started
+        return parse_response(self.text, self.schema)
+
+
+def stream_json(
+    client: Anthropic,
+    messages: list[dict],
+    schema: dict = SCHEMA,
+    model: str = MODEL,
+    metrics: list[StreamMetrics] | None = None,
+) -> dict:
+    """One streamed call validated as it
+    arrives; the stream is closed on
+    ``StreamAbort``.
+
+    Errors carry the text received so far
+    as ``partial``.
+    """
+    validator = StreamValidator(schema)
+    try:
+        with client.messages.stream(
+            model=model,
+            max_tokens=1024,
+            system=SYSTEM_PROMPT,
+            messages=messages
+        ) as stream:
+            for text in stream.text_stream:
+                validator.feed(text)
+        return validator.finish()
+    except RETRYABLE as e:
+        e.partial = validator.text
+        raise
+    finally:
+        if metrics is not None:
+            metrics.append(validator.metrics)
+
+
+def generate_streaming(
+    diff: str,
+    max_retries: int = 2,
+    client: Anthropic | None = None,
+    model: str = MODEL,
+    metrics: list[StreamMetrics] | None = None,
+) -> dict:
+    """Listing 2.6's ``generate_with_retry``
+    on streamed responses, retrying as soon
+    as output goes wrong.
+
+    Pass a list as ``metrics`` to collect a
+    ``StreamMetrics`` per attempt.
+    """
+    client = client or get_client()
+    messages = [
+        {"role": "user",
+         "content": build_prompt(diff)}
+    ]
+
+    for attempt in range(max_retries + 1):
+        try:
+            return stream_json(
+                client, messages, SCHEMA, model, metrics
+            )
+        except (StreamAbort, *RETRYABLE) as e:
+            retry_or_raise(
+                messages, e.partial, e, attempt, max_retries
+            )
+
+    raise ValueError("No attempts made")
+
+
+if __name__ == "__main__":
+    from listing_2_5_complete import format_for_github, get_git_diff
+
+    diff = get_git_diff()
+    if not diff:
+        print("No staged changes found.")
+    else:
+        metrics: list[StreamMetrics] = []
+        try:
+            pr = generate_streaming(diff, metrics=metrics)
+            print(format_for_github(pr))
+        except ValueError as e:
+            print(f"Error: {e}")
+        for i, m in enumerate(metrics, 1):
+            first = (
+                f"{m.time_to_first_field:.2f}s"
+                if m.time_to_first_field is not None else "-"
+            )
+            print(
+                f"attempt {i}: first field {first}, "
+                f"total {m.elapsed:.2f}s"
+                + (f", aborted: {m.aborted}" if m.aborted else "")
+            )
@@ -0,0 +1,518 @@
+import asyncio
+import json
+import subprocess
+import time
+
+import pytest
+from jsonschema import ValidationError
+
+import listing_2_5_complete as listing_2_5
+import pr_client
+from diff_chunker import (
+    NOTE_SYSTEM_PROMPT,
+    NOTE_TOKENS,
+    chunk_files,
+    estimate_tokens,
+    generate_large_pr_description,
+    parse_diff,
+    split_noise,
+)
+from listing_2_3_schema import SCHEMA
+from listing_2_4_validation import build_prompt
+from listing_2_5_complete import generate_pr_description
+from listing_2_6_retry import generate_with_retry
+from mock_anthropic import PR_JSON, MockAnthropicServer
+from pr_batch import RequestPacer, generate_batch
+from pr_streaming import (
+    StreamAbort,
+    StreamMetrics,
+    StreamValidator,
+    generate_streaming,
+)
+from pr_cache import PRCache, cache_key, cache_pr, normalize_diff
+
+DIFF = """diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1 +1,2 @@
+ print("hello")
++print("world")
+"""
+
+
+@pytest.fixture
+def server():
+    with MockAnthropicServer() as server:
+        pr_client.configure_client(
+            api_key="mock", base_url=server.url
+        )
+        yield server
+    pr_client.close_client()
+
+
+def test_shared_client_is_reused():
+    try:
+        assert pr_client.get_client() is pr_client.get_client()
+    finally:
+        pr_client.close_client()
+
+
+def test_configure_client_replaces_shared_client():
+    first = pr_client.configure_client(api_key="mock")
+    try:
+        second = pr_client.configure_client(api_key="mock")
+        assert second is not first
+        assert pr_client.get_client() is second
+    finally:
+        pr_client.close_client()
+
+
+def test_listings_reuse_one_connection(server):
+    for _ in range(5):
+        assert generate_pr_description(DIFF)["title"]
+    generate_with_retry(DIFF)
+    assert len(server.requests) == 6
+    assert server.connections == 1
+
+
+def test_retry_listing_through_shared_client(server):
+    replies = iter(["not json", PR_JSON])
+    server.reply = lambda request: next(replies)
+    result = generate_with_retry(DIFF)
+    assert result["title"] == "Add retry to PR generator"
+    assert len(server.requests) == 2
+    assert server.connections == 1
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    clock = FakeClock()
+    cache = PRCache(
+        str(tmp_path / "cache.sqlite3"), ttl=60,
+        max_entries=3, clock=clock,
+    )
+    yield cache
+    cache.close()
+
+
+def test_normalized_diffs_share_a_key():
+    noisy = (
+        DIFF.replace("--- a/app.py", "index 1a2b3c..4d5e6f 100644\n"
+                     "--- a/app.py")
+        .replace("\n", "\r\n")
+        + "\n\n"
+    )
+    assert normalize_diff(noisy) == normalize_diff(DIFF)
+    assert (
+        cache_key(noisy, build_prompt, "m", SCHEMA)
+        == cache_key(DIFF, build_prompt, "m", SCHEMA)
+    )
+
+
+def test_whitespace_changes_keep_their_own_key():
+    added = "@@ -1 +1 @@\n-foo\n+foo \n"
+    removed = "@@ -1 +1 @@\n-foo \n+foo\n"
+    assert normalize_diff(added) != normalize_diff(removed)
+    assert (
+        cache_key(added, build_prompt, "m", SCHEMA)
+        != cache_key(removed, build_prompt, "m", SCHEMA)
+    )
+
+
+def test_key_covers_prompt_model_and_schema():
+    key = cache_key(DIFF, build_prompt, "m", SCHEMA)
+    assert key != cache_key(DIFF, build_prompt, "other", SCHEMA)
+    assert key != cache_key(
+        DIFF, lambda d: "v2 " + build_prompt(d), "m", SCHEMA
+    )
+    assert key != cache_key(
+        DIFF, build_prompt, "m", {**SCHEMA, "minProperties": 1}
+    )
+    assert key != cache_key(DIFF + "+x\n", build_prompt, "m", SCHEMA)
+
+
+def test_cache_hit_skips_the_model(server, cache):
+    generate = cache_pr(
+        generate_with_retry, build_prompt, SCHEMA, cache=cache
+    )
+    first = generate(DIFF)
+    assert generate(DIFF) == first
+    assert len(server.requests) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_listing_2_5_cached(server, cache):
+    generate = cache_pr(
+        generate_pr_description, listing_2_5.build_prompt,
+        listing_2_5.SCHEMA, cache=cache,
+    )
+    generate(DIFF)
+    generate(DIFF.replace("\n", "\r\n"))
+    assert len(server.requests) == 1
+
+
+def test_failures_are_not_cached(server, cache):
+    server.reply = lambda request: "not json"
+    generate = cache_pr(
+        generate_with_retry, build_prompt, SCHEMA, cache=cache
+    )
+    with pytest.raises(ValueError):
+        generate(DIFF, max_retries=0)
+    assert len(cache) == 0
+
+
+def test_put_rejects_invalid_results(cache):
+    with pytest.raises(ValidationError):
+        cache.put("k", {"title": "only a title"}, SCHEMA)
+    assert len(cache) == 0
+
+
+def test_entries_expire_after_ttl(cache):
+    value = json.loads(PR_JSON)
+    cache.put("k", value, SCHEMA)
+    cache.clock.now += 59
+    assert cache.get("k") == value
+    cache.clock.now += 1
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_evicted(cache):
+    value = json.loads(PR_JSON)
+    for key in "abc":
+        cache.put(key, value, SCHEMA)
+        cache.clock.now += 1
+    cache.get("a")
+    cache.clock.now += 1
+    cache.put("d", value, SCHEMA)
+    assert cache.get("b") is None
+    assert all(cache.get(k) for k in "acd")
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = PRCache(path)
+    first.put("k", json.loads(PR_JSON), SCHEMA)
+    first.close()
+    second = PRCache(path)
+    try:
+        assert second.get("k")["title"]
+    finally:
+        second.close()
+
+
+def _batch(server, items, **kwargs) -> list:
+    async def run():
+        client = pr_client.make_async_client(
+            api_key="mock", base_url=server.url
+        )
+        try:
+            return [
+                r async for r in generate_batch(
+                    items, client=client, **kwargs
+                )
+            ]
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+
+def test_batch_runs_concurrently():
+    with MockAnthropicServer(latency=0.2) as server:
+        start = time.perf_counter()
+        results = _batch(
+            server, [DIFF] * 8,
+            concurrency=8, requests_per_minute=60_000,
+        )
+        elapsed = time.perf_counter() - start
+    assert sorted(r.index for r in results) == list(range(8))
+    assert all(r.ok and r.attempts == 1 for r in results)
+    assert elapsed < 8 * 0.2 / 2
+
+
+def test_batch_yields_as_finished_and_reports_errors():
+    def reply(request):
+        prompt = request["messages"][0]["content"]
+        if "slow" in prompt:
+            time.sleep(0.3)
+        return "oops" if "bad" in prompt else PR_JSON
+
+    with MockAnthropicServer(reply) as server:
+        results = _batch(
+            server, [DIFF + "+slow\n", DIFF + "+bad\n", ""],
+            concurrency=3, requests_per_minute=60_000,
+            max_retries=1,
+        )
+    assert [r.index for r in results][-1] == 0
+    by_index = {r.index: r for r in results}
+    assert by_index[0].ok
+    assert "Failed after 2 attempts" in by_index[1].error
+    assert "No staged changes" in by_index[2].error
+
+
+def test_batch_reads_repository_paths(tmp_path, cache):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    (repo / "app.py").write_text("print('hi')\n")
+    subprocess.run(["git", "add", "app.py"], cwd=repo, check=True)
+
+    with MockAnthropicServer() as server:
+        first = _batch(server, [str(repo)], cache=cache)
+        second = _batch(server, [str(repo)], cache=cache)
+        assert "app.py" in server.requests[0]["messages"][0][
+            "content"
+        ]
+        assert len(server.requests) == 1
+    assert first[0].source == str(repo) and first[0].ok
+    assert second[0].cached
+
+
+def test_request_pacer_spaces_calls():
+    async def run():
+        pacer = RequestPacer(requests_per_minute=600)
+        start = time.perf_counter()
+        for _ in range(4):
+            await pacer.wait()
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) >= 3 * 0.1 - 0.01
+
+
+def _file_diff(path: str, hunks: int = 1, size: int = 1) -> str:
+    body = "".join(
+        f"@@ -{i},1 +{i},2 @@\n" + "".join(
+            f"+line {i}.{j}\n" for j in range(size)
+        )
+        for i in range(1, hunks + 1)
+    )
+    return (
+        f"diff --git a/{path} b/{path}\n"
+        f"--- a/{path}\n+++ b/{path}\n{body}"
+    )
+
+
+BINARY = (
+    "diff --git a/logo.png b/logo.png\n"
+    "index 1a2b3c..4d5e6f 100644\n"
+    "Binary files a/logo.png and b/logo.png differ\n"
+)
+
+
+def test_parse_diff_splits_files_and_hunks():
+    diff = _file_diff("src/app.py", hunks=3) + BINARY
+    files = parse_diff(diff)
+    assert [f.path for f in files] == ["src/app.py", "logo.png"]
+    assert len(files[0].hunks) == 3
+    assert files[1].binary and not files[0].binary
+    assert "".join(f.text for f in files) == diff
+
+
+def test_noise_is_dropped():
+    generated = _file_diff("api_pb2.py") + _file_diff(
+        "gen.py"
+    ).replace("+line 1.0", "+# @generated by protoc")
+    diff = (
+        _file_diff("src/app.py")
+        + _file_diff("web/package-lock.json")
+        + _file_diff("web/dist/bundle.js")
+        + generated
+        + BINARY
+    )
+    kept, dropped = split_noise(parse_diff(diff))
+    assert [f.path for f in kept] == ["src/app.py"]
+    assert dropped == [
+        "web/package-lock.json", "web/dist/bundle.js",
+        "api_pb2.py", "gen.py", "logo.png",
+    ]
+
+
+def test_markers_only_count_at_top_of_new_file():
+    context = (
+        "diff --git a/app/config.py b/app/config.py\n"
+        "--- a/app/config.py\n+++ b/app/config.py\n"
+        "@@ -40,2 +40,3 @@\n"
+        " # DO NOT EDIT the defaults below\n"
+        "+TIMEOUT = 5\n"
+    )
+    removed = (
+        "diff --git a/gen.py b/gen.py\n"
+        "--- a/gen.py\n+++ b/gen.py\n"
+        "@@ -1,2 +1,1 @@\n"
+        "-# @generated by protoc\n"
+        " x = 1\n"
+    )
+    kept, dropped = split_noise(parse_diff(context + removed))
+    assert [f.path for f in kept] == ["app/config.py", "gen.py"]
+    assert dropped == []
+
+
+def test_chunks_respect_budget_and_split_on_hunks():
+    files = parse_diff(
+        _file_diff("big.py", hunks=40, size=20)
+        + _file_diff("small.py")
+    )
+    chunks = chunk_files(files, chunk_tokens=500)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 500 for c in chunks)
+    assert all(c.startswith("diff --git") for c in chunks)
+    text = "".join(chunks)
+    assert text.count("+line 40.19") == 1
+    assert "small.py" in chunks[-1]
+
+
+def test_small_diff_takes_one_call(server):
+    diff = _file_diff("app.py") + _file_diff("yarn.lock", size=500)
+    result = generate_large_pr_description(diff, token_budget=2000,
+                                           chunk_tokens=500)
+    assert result["title"]
+    (request,) = server.requests
+    assert "yarn.lock" not in request["messages"][0]["content"]
+
+
+def test_large_diff_is_mapped_then_reduced(server):
+    def reply(request):
+        if request["system"] == NOTE_SYSTEM_PROMPT:
+            return "- changed lines"
+        return PR_JSON
+
+    server.reply = reply
+    diff = "".join(
+        _file_diff(f"mod{i}.py", hunks=5, size=20) for i in range(8)
+    ) + BINARY
+    result = generate_large_pr_description(
+        diff, token_budget=1500, chunk_tokens=500, max_workers=4
+    )
+    assert result["title"] == "Add retry to PR generator"
+    notes = [
+        r for r in server.requests
+        if r["system"] == NOTE_SYSTEM_PROMPT
+    ]
+    assert len(notes) == len(server.requests) - 1 > 1
+    final = server.requests[-1]["messages"][0]["content"]
+    assert "logo.png" in final
+    assert estimate_tokens(final) <= 1500
+
+
+def test_long_notes_are_reduced_within_budget(server):
+    """Notes longer than NOTE_TOKENS still
+    reduce to one prompt under budget."""
+    def reply(request):
+        if request["system"] == NOTE_SYSTEM_PROMPT:
+            return "- changed lines " * 500
+        return PR_JSON
+
+    server.reply = reply
+    diff = "".join(
+        _file_diff(f"mod{i}.py", hunks=5, size=20) for i in range(8)
+    )
+    result = generate_large_pr_description(
+        diff, token_budget=900, chunk_tokens=NOTE_TOKENS
+    )
+    assert result["title"] == "Add retry to PR generator"
+    assert all(
+        estimate_tokens(r["messages"][0]["content"]) <= 900
+        for r in server.requests
+    )
+
+
+def test_chunk_tokens_below_a_note_are_rejected():
+    with pytest.raises(ValueError, match="chunk_tokens"):
+        generate_large_pr_description(
+            _file_diff("app.py"), chunk_tokens=NOTE_TOKENS - 1
+        )
+    with pytest.raises(ValueError, match="token_budget"):
+        generate_large_pr_description(
+            _file_diff("app.py"), token_budget=800,
+            chunk_tokens=NOTE_TOKENS,
+        )
+
+
+def _feed(text: str, size: int = 3) -> StreamValidator:
+    validator = StreamValidator()
+    for i in range(0, len(text), size):
+        validator.feed(text[i:i + size])
+    return validator
+
+
+def test_stream_validator_accepts_valid_json_in_pieces():
+    text = json.dumps(json.loads(PR_JSON), indent=2)
+    validator = _feed(text.replace("retry", 'say \\"hi\\" {['))
+    assert validator.finish()["summary"]
+    assert validator.metrics.fields == [
+        "title", "summary", "tests", "risks"
+    ]
+    assert validator.metrics.time_to_first_field is not None
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("Here is the JSON: " + PR_JSON, "before the JSON"),
+    ("```json\n" + PR_JSON, "before the JSON"),
+    ('{"title": "x", "author": "me"', "unexpected key 'author'"),
+    ('{"title": ["x"]', "should be string"),
+    ('{"title": "x", "summary": "y"', "should be array"),
+    ('{"title": "x", "summary": ["a", 1', "items of 'summary'"),
+    (PR_JSON + "\nHope this helps!", "after the JSON"),
+])
+def test_stream_validator_aborts_early(text, reason):
+    with pytest.raises(StreamAbort, match=reason) as info:
+        _feed(text)
+    assert info.value.partial
+    assert len(info.value.partial) <= len(text)
+
+
+def test_stream_validator_defers_whole_object_checks():
+    validator = _feed('{"title": "x", "summary": ["one"]}')
+    with pytest.raises(ValidationError):
+        validator.finish()
+
+
+def test_streaming_aborts_and_retries_early():
+    prose = "Sure! Here is a description of your change. " * 20
+    replies = iter([prose + PR_JSON, PR_JSON])
+    server = MockAnthropicServer(
+        lambda request: next(replies),
+        stream_chunk=4, stream_delay=0.01,
+    )
+    with server:
+        client = pr_client.make_client(
+            api_key="mock", base_url=server.url
+        )
+        metrics: list[StreamMetrics] = []
+        start = time.perf_counter()
+        result = generate_streaming(
+            DIFF, client=client, metrics=metrics
+        )
+        elapsed = time.perf_counter() - start
+        client.close()
+    assert result["title"] == "Add retry to PR generator"
+    first, second = metrics
+    assert first.aborted == "text before the JSON object"
+    assert first.characters < 20
+    assert first.time_to_first_field is None
+    assert second.aborted is None
+    assert 0 < second.time_to_first_field < second.elapsed
+    # The prose alone would stream for ~2.2s
+    assert elapsed < len(prose) / 4 * 0.01
+    retry = server.requests[1]["messages"]
+    assert retry[1]["role"] == "assistant"
+    assert "invalid" in retry[2]["content"]
+
+
+def test_streaming_gives_up_after_retries(server):
+    server.reply = lambda request: '{"title": "x", "extra": 1}'
+    metrics: list[StreamMetrics] = []
+    with pytest.raises(ValueError, match="Failed after 2 attempts"):
+        generate_streaming(DIFF, max_retries=1, metrics=metrics)
+    assert [m.aborted for m in metrics] == [
+        "unexpected key 'extra'"
+    ] * 2
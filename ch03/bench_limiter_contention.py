@@ -0,0 +1,90 @@
+"""Contention benchmark for the in-memory limiter stores.
+
+Runs ``--threads`` workers hammering one ``InMemoryLimiter`` and
+reports checks per second for a single-lock store (``ShardedStore``
+with one shard) against lock-striped stores. Usage:
+
+    python bench_limiter_contention.py --threads 1 2 4 8 --shards 1 64
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from limiter_sharded import ShardedStore
+from rate_limiter import InMemoryLimiter
+
+
+def run(
+    threads: int,
+    shards: int,
+    checks: int,
+    users: int,
+    strategy: str,
+) -> float:
+    """Checks per second with ``threads``
+    workers sharing one limiter."""
+    limiter = InMemoryLimiter(
+        100, 60, strategy, store=ShardedStore(shards)
+    )
+    per_thread = checks // threads
+    keys = [
+        [f"user{random.randrange(users)}"
+         for _ in range(per_thread)]
+        for _ in range(threads)
+    ]
+    barrier = threading.Barrier(threads + 1)
+
+    def work(my_keys):
+        hit = limiter.hit
+        barrier.wait()
+        for key in my_keys:
+            hit(key)
+
+    workers = [
+        threading.Thread(target=work, args=(k,))
+        for k in keys
+    ]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1, 2, 4, 8]
+    )
+    parser.add_argument(
+        "--shards", type=int, nargs="+", default=[1, 64]
+    )
+    parser.add_argument("--checks", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--strategy", default="sliding_window")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'threads':>7} {'shards':>6} {'checks/s':>12}")
+    for threads in args.threads:
+        for shards in args.shards:
+            best = max(
+                run(
+                    threads,
+                    shards,
+                    args.checks,
+                    args.users,
+                    args.strategy,
+                )
+                for _ in range(args.repeat)
+            )
+            print(f"{threads:>7} {shards:>6} {best:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Load and memory benchmarks for the in-memory and Redis limiters.
+
+Drives the ``rate_limit`` decorator (``memory`` backend) and
+``check_rate_limit`` (``redis`` backend) with ``--users`` distinct
+keys drawn from a Zipf distribution (``--skew 0`` is uniform; around
+1 is typical API traffic) from ``--concurrency`` concurrent tasks.
+For each backend and strategy it reports throughput, p50/p99/p999
+latency, the share of requests denied and memory per tracked user.
+
+The Redis backend uses fakeredis unless ``--redis-url`` points at a
+real server (e.g. a local ``redis-server``). fakeredis runs in
+process, so its latencies exclude the network and Redis memory is
+reported only for real servers, via ``MEMORY USAGE``. Each run keys
+its users under a random ``bench-<id>:`` namespace and deletes only
+those keys afterwards, so a shared server's other data is untouched.
+
+Results are written as JSON for comparing strategies across runs:
+
+    python bench_rate_limiters.py --backend memory redis \\
+        --users 10000 --skew 1.1 --output results.json
+"""
+
+import argparse
+import asyncio
+import bisect
+import gc
+import itertools
+import json
+import platform
+import random
+import time
+import tracemalloc
+import uuid
+
+from fastapi import HTTPException
+
+from limiter_algorithms import STRATEGIES
+from limiter_ring import RingBufferLimiter
+from rate_limiter import InMemoryLimiter, rate_limit
+from redis_rate_limiter import STRATEGIES as REDIS_STRATEGIES
+from redis_rate_limiter import KEY_PREFIX, check_rate_limit
+
+# "ring" is limiter_ring's exact sliding
+# window
+MEMORY_STRATEGIES = STRATEGIES + ("ring",)
+
+MAX_REQUESTS = 100
+WINDOW_SECONDS = 60
+# Keys sampled for Redis MEMORY USAGE
+MEMORY_SAMPLE = 200
+
+
+def zipf_keys(
+    users: int,
+    skew: float,
+    count: int,
+    seed: int = 0,
+) -> list[str]:
+    """``count`` user ids where the user of
+    rank k is drawn with weight ``1 / k**skew``."""
+    rng = random.Random(seed)
+    weights = [1 / k ** skew for k in range(1, users + 1)]
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    return [
+        f"user{bisect.bisect(cumulative, rng.random() * total)}"
+        for _ in range(count)
+    ]
+
+
+def percentiles(latencies: list[float]) -> dict:
+    """p50/p99/p999 and max in
+    microseconds."""
+    ordered = sorted(latencies)
+    n = len(ordered)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(n - 1, int(q * n))] * 1e6, 2)
+
+    return {
+        "p50_us": pick(0.50),
+        "p99_us": pick(0.99),
+        "p999_us": pick(0.999),
+        "max_us": round(ordered[-1] * 1e6, 2),
+    }
+
+
+async def _drive(check, keys: list[str], concurrency: int):
+    """Run ``check(key)`` over ``keys`` from
+    ``concurrency`` tasks; return (elapsed,
+    latencies, denied)."""
+    latencies: list[float] = []
+    denied = 0
+    feed = iter(keys)
+
+    async def worker():
+        nonlocal denied
+        perf = time.perf_counter
+        for key in feed:
+            start = perf()
+            allowed = await check(key)
+            latencies.append(perf() - start)
+            denied += not allowed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, denied
+
+
+def _memory_limiter(strategy: str, max_keys: int):
+    if strategy == "ring":
+        return RingBufferLimiter(
+            MAX_REQUESTS, WINDOW_SECONDS, max_keys
+        )
+    return InMemoryLimiter(
+        MAX_REQUESTS, WINDOW_SECONDS, strategy,
+        max_keys=max_keys,
+    )
+
+
+def _memory_check(strategy: str, users: int):
+    """``rate_limit``-decorated endpoint
+    wrapped as a ``check(user_id)``."""
+    limiter = _memory_limiter(strategy, users)
+
+    @rate_limit(limiter=limiter)
+    async def endpoint(request):
+        return None
+
+    class _State:
+        pass
+
+    class _Request:
+        def __init__(self):
+            self.state = _State()
+
+    request = _Request()
+
+    async def check(user_id: str) -> bool:
+        request.state.user_id = user_id
+        try:
+            await endpoint(request)
+        except HTTPException:
+            return False
+        return True
+
+    return check, limiter
+
+
+def _memory_per_user(strategy: str, users: int) -> float:
+    """Bytes allocated per user after each of
+    ``users`` users sends ``MAX_REQUESTS``
+    requests."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    limiter = _memory_limiter(strategy, users)
+    for i in range(users):
+        for _ in range(MAX_REQUESTS):
+            limiter.hit(f"user{i}")
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(
+        s.size_diff for s in after.compare_to(before, "filename")
+    )
+    return round(grown / users, 1)
+
+
+async def _namespace_keys(client, namespace: str) -> list:
+    """Every limiter key under
+    ``namespace``, for any strategy."""
+    prefix = KEY_PREFIX + namespace
+    return [
+        k
+        for pattern in (prefix + "*", "{" + prefix + "*")
+        async for k in client.scan_iter(pattern)
+    ]
+
+
+async def _redis_memory_per_user(client, keys: list, users: int):
+    """Mean ``MEMORY USAGE`` of sampled
+    limiter keys times keys per user, or None
+    where the command is unavailable."""
+    if not keys:
+        return None
+    try:
+        sizes = [
+            await client.memory_usage(k)
+            for k in keys[:MEMORY_SAMPLE]
+        ]
+    except Exception:
+        return None
+    per_key = sum(sizes) / len(sizes)
+    return round(per_key * len(keys) / users, 1)
+
+
+async def bench_memory(
+    strategy: str,
+    keys: list[str],
+    concurrency: int,
+    memory_users: int,
+) -> dict:
+    check, limiter = _memory_check(
+        strategy, len(set(keys))
+    )
+    elapsed, latencies, denied = await _drive(
+        check, keys, concurrency
+    )
+    return {
+        "backend": "memory",
+        "strategy": strategy,
+        "throughput_rps": round(len(keys) / elapsed, 1),
+        **percentiles(latencies),
+        "denied_ratio": round(denied / len(keys), 4),
+        "tracked_users": len(limiter),
+        "bytes_per_user": _memory_per_user(
+            strategy, memory_users
+        ),
+    }
+
+
+async def bench_redis(
+    client,
+    strategy: str,
+    keys: list[str],
+    concurrency: int,
+) -> dict:
+    namespace = f"bench-{uuid.uuid4().hex[:8]}:"
+
+    async def check(user_id: str) -> bool:
+        return await check_rate_limit(
+            namespace + user_id, MAX_REQUESTS, WINDOW_SECONDS,
+            client, strategy,
+        )
+
+    try:
+        elapsed, latencies, denied = await _drive(
+            check, keys, concurrency
+        )
+        tracked = len(set(keys))
+        created = await _namespace_keys(client, namespace)
+        return {
+            "backend": "redis",
+            "strategy": strategy,
+            "throughput_rps": round(len(keys) / elapsed, 1),
+            **percentiles(latencies),
+            "denied_ratio": round(denied / len(keys), 4),
+            "tracked_users": tracked,
+            "keys_per_user": round(len(created) / tracked, 2),
+            "bytes_per_user": await _redis_memory_per_user(
+                client, created, tracked
+            ),
+        }
+    finally:
+        created = await _namespace_keys(client, namespace)
+        for i in range(0, len(created), 1000):
+            await client.delete(*created[i:i + 1000])
+
+
+async def run_suite(
+    backends: list[str],
+    strategies: list[str] | None,
+    users: int,
+    skew: float,
+    requests: int,
+    concurrency: int,
+    redis_url: str | None = None,
+    memory_users: int = 1000,
+    seed: int = 0,
+) -> dict:
+    """Run every backend/strategy pair and
+    return the JSON-ready report."""
+    keys = zipf_keys(users, skew, requests, seed)
+    results = []
+    for backend in backends:
+        if backend == "memory":
+            for strategy in strategies or MEMORY_STRATEGIES:
+                if strategy in MEMORY_STRATEGIES:
+                    results.append(await bench_memory(
+                        strategy, keys, concurrency,
+                        memory_users,
+                    ))
+            continue
+        if redis_url:
+            import redis.asyncio as redis
+            client = redis.from_url(redis_url)
+        else:
+            import fakeredis
+            client = fakeredis.FakeAsyncRedis()
+        try:
+            for strategy in strategies or REDIS_STRATEGIES:
+                if strategy in REDIS_STRATEGIES:
+                    results.append(await bench_redis(
+                        client, strategy, keys, concurrency
+                    ))
+        finally:
+            await client.aclose()
+    return {
+        "config": {
+            "users": users,
+            "skew": skew,
+            "requests": requests,
+            "concurrency": concurrency,
+            "max_requests": MAX_REQUESTS,
+            "window_seconds": WINDOW_SECONDS,
+            "redis": redis_url or "fakeredis",
+            "python": platform.python_version(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--backend", nargs="+", default=["memory", "redis"],
+        choices=["memory", "redis"],
+    )
+    parser.add_argument("--strategy", nargs="+")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--memory-users", type=int, default=1000)
+    parser.add_argument("--redis-url")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_suite(
+        args.backend,
+        args.strategy,
+        args.users,
+        args.skew,
+        args.requests,
+        args.concurrency,
+        args.redis_url,
+        args.memory_users,
+        args.seed,
+    ))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"{'backend':<8} {'strategy':<15} {'rps':>10} "
+        f"{'p50us':>8} {'p99us':>8} {'p999us':>8} "
+        f"{'B/user':>8}"
+    )
+    for r in report["results"]:
+        print(
+            f"{r['backend']:<8} {r['strategy']:<15} "
+            f"{r['throughput_rps']:>10,.0f} "
+            f"{r['p50_us']:>8} {r['p99_us']:>8} "
+            f"{r['p999_us']:>8} "
+            f"{r['bytes_per_user'] or '-':>8}"
+        )
+    print(f"(results saved to {args.output})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Asyncio event-processing pipeline with bounded queues.
+
+``process_events_async`` consumes an async iterable of NDJSON chunks
+(bytes or str, split anywhere), e.g. a socket or an object-store
+download, so nothing has to be staged on disk first. Four stages run as
+tasks connected by bounded queues:
+
+    reader -> parser -> filter -> aggregator
+
+Lines travel in batches to keep per-item asyncio overhead low. When a
+stage falls behind, the queue in front of it fills and upstream ``put``
+calls block, so memory stays flat at about ``queue_size * batch_size``
+lines per queue. ``PipelineStats`` exposes per-stage counters while the
+pipeline runs.
+
+With more than one task in a stage, batches can finish out of order, so
+``per_user`` order may differ from the input order; counts and types do
+not change.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Callable
+
+from event_stream import EventAggregate, finish_summary
+from timestamp_fast import EpochRange, TimestampParser
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 64
+BATCH_SIZE = 1024
+READ_SIZE = 1 << 16
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Counters for one pipeline stage.
+
+    Items are events, except that the
+    reader counts bytes in and lines out.
+    ``blocked_seconds`` is time spent
+    waiting on a full downstream queue.
+    """
+
+    name: str
+    tasks: int = 1
+    items_in: int = 0
+    items_out: int = 0
+    batches: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items handled per busy second."""
+        if not self.busy_seconds:
+            return 0.0
+        return self.items_in / self.busy_seconds
+
+
+@dataclass
+class PipelineStats:
+    """Live counters for every stage plus
+    current queue depths."""
+
+    stages: dict[str, StageStats] = field(
+        default_factory=dict
+    )
+    queues: dict[str, asyncio.Queue] = field(
+        default_factory=dict, repr=False
+    )
+
+    def queue_depths(self) -> dict[str, int]:
+        return {
+            name: q.qsize()
+            for name, q in self.queues.items()
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            name: {
+                "tasks": s.tasks,
+                "items_in": s.items_in,
+                "items_out": s.items_out,
+                "batches": s.batches,
+                "busy_seconds": round(s.busy_seconds, 6),
+                "blocked_seconds": round(
+                    s.blocked_seconds, 6
+                ),
+                "throughput": round(s.throughput, 1),
+            }
+            for name, s in self.stages.items()
+        }
+
+
+async def aiter_file(
+    path: str,
+    chunk_size: int = READ_SIZE,
+) -> AsyncIterator[bytes]:
+    """Read a local file in chunks without
+    blocking the event loop."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(
+                f.read, chunk_size
+            )
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _put(
+    q: asyncio.Queue, item, stats: StageStats
+) -> None:
+    start = time.perf_counter()
+    await q.put(item)
+    stats.blocked_seconds += time.perf_counter() - start
+
+
+async def _read(
+    source: AsyncIterable[bytes | str],
+    out: asyncio.Queue,
+    batch_size: int,
+    stats: StageStats,
+) -> None:
+    """Split chunks into lines and emit
+    batches of complete lines."""
+    pending = b""
+    batch: list[bytes] = []
+    async for chunk in source:
+        start = time.perf_counter()
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        stats.items_in += len(chunk)
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        batch.extend(line for line in lines if line.strip())
+        stats.busy_seconds += time.perf_counter() - start
+        while len(batch) >= batch_size:
+            stats.items_out += batch_size
+            stats.batches += 1
+            await _put(out, batch[:batch_size], stats)
+            del batch[:batch_size]
+    if pending.strip():
+        batch.append(pending)
+    if batch:
+        stats.items_out += len(batch)
+        stats.batches += 1
+        await _put(out, batch, stats)
+
+
+def _parse_batch(lines: list[bytes]) -> list[dict]:
+    return [json.loads(line) for line in lines]
+
+
+async def _parse(
+    inq: asyncio.Queue,
+    out: asyncio.Queue,
+    stats: StageStats,
+    executor: Executor | None,
+) -> None:
+    loop = asyncio.get_running_loop()
+    while (lines := await inq.get()) is not _DONE:
+        start = time.perf_counter()
+        if executor is None:
+            events = _parse_batch(lines)
+        else:
+            events = await loop.run_in_executor(
+                executor, _parse_batch, lines
+            )
+        stats.busy_seconds += time.perf_counter() - start
+        stats.items_in += len(lines)
+        stats.items_out += len(events)
+        stats.batches += 1
+        await _put(out, events, stats)
+
+
+async def _filter(
+    inq: asyncio.Queue,
+    out: asyncio.Queue,
+    stats: StageStats,
+    bounds: EpochRange,
+    parser: TimestampParser,
+) -> None:
+    lo, hi = bounds.start_us, bounds.end_us
+    parse = parser.parse
+    while (events := await inq.get()) is not _DONE:
+        start = time.perf_counter()
+        kept = []
+        skipped = 0
+        for event in events:
+            us = parse(event.get("timestamp", ""))
+            if us is None:
+                skipped += 1
+            elif lo <= us <= hi:
+                kept.append(event)
+        stats.busy_seconds += time.perf_counter() - start
+        stats.items_in += len(events)
+        stats.items_out += len(kept)
+        stats.batches += 1
+        await _put(out, (kept, skipped), stats)
+
+
+async def _aggregate(
+    inq: asyncio.Queue,
+    aggregate: EventAggregate,
+    stats: StageStats,
+) -> None:
+    while (item := await inq.get()) is not _DONE:
+        start = time.perf_counter()
+        kept, skipped = item
+        for event in kept:
+            aggregate.add(event)
+        aggregate.skipped += skipped
+        stats.busy_seconds += time.perf_counter() - start
+        stats.items_in += len(kept)
+        stats.batches += 1
+
+
+async def _stage(
+    workers: list[Callable],
+    out: asyncio.Queue | None,
+    downstream: int,
+) -> None:
+    """Run a stage's tasks, then tell every
+    downstream task that input has ended."""
+    await asyncio.gather(*(w() for w in workers))
+    if out is not None:
+        for _ in range(downstream):
+            await out.put(_DONE)
+
+
+async def process_events_async(
+    source: AsyncIterable[bytes | str],
+    output_path: str,
+    start_date: datetime,
+    end_date: datetime,
+    *,
+    queue_size: int = QUEUE_SIZE,
+    batch_size: int = BATCH_SIZE,
+    parser_tasks: int = 1,
+    filter_tasks: int = 1,
+    executor: Executor | None = None,
+    stats: PipelineStats | None = None,
+    output_format: str = "json",
+) -> dict:
+    """Process an async stream of NDJSON
+    events into the usual summary.
+
+    ``parser_tasks`` and ``filter_tasks``
+    set per-stage concurrency. Passing an
+    ``executor`` moves JSON decoding off the
+    event loop. Pass a ``PipelineStats`` to
+    watch stage counters while it runs.
+
+    Raises:
+        ValueError: if ``queue_size``,
+            ``batch_size``, ``parser_tasks``
+            or ``filter_tasks`` is below 1
+    """
+    for name, value in (
+        ("queue_size", queue_size),
+        ("batch_size", batch_size),
+        ("parser_tasks", parser_tasks),
+        ("filter_tasks", filter_tasks),
+    ):
+        if value < 1:
+            raise ValueError(f"{name} must be at least 1")
+    if stats is None:
+        stats = PipelineStats()
+    bounds = EpochRange.from_datetimes(
+        start_date, end_date
+    )
+    lines_q = asyncio.Queue(queue_size)
+    events_q = asyncio.Queue(queue_size)
+    kept_q = asyncio.Queue(queue_size)
+    stats.queues.update(
+        lines=lines_q, events=events_q, kept=kept_q
+    )
+    s = stats.stages
+    s["reader"] = StageStats("reader")
+    s["parser"] = StageStats("parser", parser_tasks)
+    s["filter"] = StageStats("filter", filter_tasks)
+    s["aggregator"] = StageStats("aggregator")
+
+    parser = TimestampParser()
+    aggregate = EventAggregate()
+    tasks = [
+        asyncio.ensure_future(_stage(
+            [lambda: _read(
+                source, lines_q, batch_size, s["reader"]
+            )],
+            lines_q,
+            parser_tasks,
+        )),
+        asyncio.ensure_future(_stage(
+            [
+                lambda: _parse(
+                    lines_q, events_q, s["parser"], executor
+                )
+            ] * parser_tasks,
+            events_q,
+            filter_tasks,
+        )),
+        asyncio.ensure_future(_stage(
+            [
+                lambda: _filter(
+                    events_q, kept_q, s["filter"],
+                    bounds, parser,
+                )
+            ] * filter_tasks,
+            kept_q,
+            1,
+        )),
+        asyncio.ensure_future(_stage(
+            [lambda: _aggregate(
+                kept_q, aggregate, s["aggregator"]
+            )],
+            None,
+            0,
+        )),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    parser.flush_warnings()
+
+    logger.debug("Pipeline stats: %s", stats.as_dict())
+    return await asyncio.to_thread(
+        finish_summary, aggregate, output_path, output_format
+    )
@@ -0,0 +1,232 @@
+"""Columnar event batches for vectorized aggregation.
+
+Events are stored as three parallel NumPy columns: epoch-microsecond
+timestamps (int64) and dictionary-encoded user and type codes. Date
+filtering becomes a boolean mask, and per-user counts and type sets come
+from ``bincount`` and ``unique`` instead of a Python loop per event.
+Batches can be saved to ``.npz`` so repeated runs over the same input
+skip JSON parsing entirely.
+"""
+
+import json
+import logging
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+import numpy as np
+
+from event_io import open_events
+from event_stream import (
+    EventAggregate,
+    finish_summary,
+    iter_events,
+)
+from timestamp_fast import EpochRange, TimestampParser
+
+logger = logging.getLogger(__name__)
+
+# Timestamp value for rows that failed to
+# parse; below every real bound
+MISSING_TS = np.iinfo(np.int64).min
+
+# Code for a missing user_id or type field;
+# an explicit null gets a code of its own
+MISSING_CODE = -1
+_ABSENT = object()
+
+
+@dataclass
+class EventBatch:
+    """A batch of events as parallel
+    columns."""
+
+    timestamps: np.ndarray      # int64 epoch us
+    user_codes: np.ndarray      # int32 into users
+    type_codes: np.ndarray      # int32 into types
+    users: list                 # user_id values
+    types: list                 # type values
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def from_events(
+        cls,
+        events: Iterable[dict],
+    ) -> "EventBatch":
+        """Encode events into columns.
+
+        Codes are assigned in first-seen order;
+        ``null`` is a value like any other,
+        only an absent field is missing.
+        Columns grow in compact ``array``
+        buffers, never as lists of Python
+        objects.
+        """
+        parse = TimestampParser().parse
+        ts = array("q")
+        ucodes = array("i")
+        tcodes = array("i")
+        user_ids: dict = {}
+        type_ids: dict = {}
+        for event in events:
+            us = parse(event.get("timestamp", ""))
+            ts.append(MISSING_TS if us is None else us)
+            uid = event.get("user_id", _ABSENT)
+            if uid is _ABSENT:
+                ucodes.append(MISSING_CODE)
+            else:
+                ucodes.append(
+                    user_ids.setdefault(uid, len(user_ids))
+                )
+            etype = event.get("type", _ABSENT)
+            if etype is _ABSENT:
+                tcodes.append(MISSING_CODE)
+            else:
+                tcodes.append(
+                    type_ids.setdefault(etype, len(type_ids))
+                )
+        return cls(
+            np.frombuffer(ts, dtype=np.int64),
+            np.frombuffer(ucodes, dtype=np.int32),
+            np.frombuffer(tcodes, dtype=np.int32),
+            list(user_ids),
+            list(type_ids),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EventBatch":
+        """Read a batch written by ``save``."""
+        with np.load(path) as data:
+            return cls(
+                data["timestamps"],
+                data["user_codes"],
+                data["type_codes"],
+                json.loads(data["users"].item()),
+                json.loads(data["types"].item()),
+            )
+
+    def save(self, path: str) -> None:
+        """Write the batch as an uncompressed
+        ``.npz`` archive.
+
+        User and type values are stored as
+        JSON, so ``1`` and ``"1"`` stay
+        distinct.
+        """
+        np.savez(
+            path,
+            timestamps=self.timestamps,
+            user_codes=self.user_codes,
+            type_codes=self.type_codes,
+            users=np.array(json.dumps(self.users)),
+            types=np.array(json.dumps(self.types)),
+        )
+
+    def skipped(self) -> int:
+        """Rows whose timestamp did not
+        parse."""
+        return int(
+            np.count_nonzero(
+                self.timestamps == MISSING_TS
+            )
+        )
+
+    def mask(self, bounds: EpochRange) -> np.ndarray:
+        """Boolean mask of rows inside
+        ``bounds``."""
+        ts = self.timestamps
+        return (ts >= bounds.start_us) & (ts <= bounds.end_us)
+
+    def aggregate(
+        self, bounds: EpochRange
+    ) -> EventAggregate:
+        """Vectorized equivalent of
+        ``fold_events`` over this batch.
+
+        Raises:
+            KeyError: if a matching row has no
+                ``user_id`` or ``type``, as
+                Listing 3.7 would
+        """
+        keep = self.mask(bounds)
+        ucodes = self.user_codes[keep]
+        tcodes = self.type_codes[keep]
+        if ucodes.size and ucodes.min() == MISSING_CODE:
+            raise KeyError("user_id")
+        if tcodes.size and tcodes.min() == MISSING_CODE:
+            raise KeyError("type")
+
+        # First matching row per user keeps the
+        # per_user order of Listing 3.7
+        present, first = np.unique(
+            ucodes, return_index=True
+        )
+        order = present[np.argsort(first)]
+        counts = np.bincount(
+            ucodes, minlength=len(self.users)
+        )
+
+        n_types = max(len(self.types), 1)
+        pairs = np.unique(
+            ucodes.astype(np.int64) * n_types + tcodes
+        )
+        types_by_user: dict[int, set] = {}
+        for ucode, tcode in zip(
+            (pairs // n_types).tolist(),
+            (pairs % n_types).tolist(),
+        ):
+            types_by_user.setdefault(ucode, set()).add(
+                self.types[tcode]
+            )
+
+        aggregate = EventAggregate(
+            total_events=int(ucodes.size),
+            skipped=self.skipped(),
+        )
+        for ucode in order.tolist():
+            aggregate.users[self.users[ucode]] = {
+                "count": int(counts[ucode]),
+                "types": types_by_user[ucode],
+            }
+        return aggregate
+
+
+def process_events_columnar(
+    input_path: str,
+    output_path: str,
+    start_date: datetime,
+    end_date: datetime,
+    input_format: str = "json",
+    batch_path: str | None = None,
+    output_format: str = "json",
+    compression: str = "auto",
+) -> dict:
+    """Process user events through a
+    columnar batch.
+
+    ``input_format`` may also be ``"npz"``
+    to read a batch saved earlier. When
+    ``batch_path`` is given, the encoded
+    batch is saved there for later runs.
+    """
+    if input_format == "npz":
+        batch = EventBatch.load(input_path)
+    else:
+        with open_events(input_path, compression) as f:
+            batch = EventBatch.from_events(
+                iter_events(f, input_format)
+            )
+    if batch_path is not None:
+        batch.save(batch_path)
+
+    aggregate = batch.aggregate(
+        EpochRange.from_datetimes(
+            start_date, end_date
+        )
+    )
+    return finish_summary(
+        aggregate, output_path, output_format
+    )
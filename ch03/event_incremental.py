@@ -0,0 +1,193 @@
+"""Incremental, resumable event summaries for append-only NDJSON input.
+
+After each run the aggregate state and the byte offset of the last
+complete line are saved to a checkpoint next to ``output_path``. The
+next run reloads that state, folds in only the lines appended since,
+and writes the merged summary. If the input was truncated or replaced,
+or the date range changed, the checkpoint is discarded and the summary
+is rebuilt from the start.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+from event_parallel import iter_shard_lines
+from event_stream import (
+    EventAggregate,
+    finish_summary,
+    fold_events,
+)
+from summary_writer import atomic_open
+from timestamp_fast import EpochRange
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+CHECKPOINT_VERSION = 2
+
+# Bytes hashed to recognize the same file
+# after it has grown
+FINGERPRINT_BYTES = 4096
+
+
+def checkpoint_path(output_path: str) -> str:
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def _fingerprint(input_path: str, offset: int) -> str:
+    with open(input_path, "rb") as f:
+        head = f.read(min(offset, FINGERPRINT_BYTES))
+    return hashlib.sha256(head).hexdigest()
+
+
+def load_checkpoint(
+    path: str,
+    input_path: str,
+    bounds: EpochRange,
+) -> tuple[EventAggregate, int] | None:
+    """Saved ``(aggregate, offset)`` if the
+    checkpoint still applies to this input
+    and date range, else None."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(
+            "Ignoring unreadable checkpoint "
+            "%s: %s", path, e
+        )
+        return None
+
+    offset = state.get("offset", 0)
+    if (
+        state.get("version") != CHECKPOINT_VERSION
+        or state.get("start_us") != bounds.start_us
+        or state.get("end_us") != bounds.end_us
+    ):
+        logger.info(
+            "Checkpoint %s does not match this "
+            "run; recomputing", path
+        )
+        return None
+    if (
+        os.path.getsize(input_path) < offset
+        or _fingerprint(input_path, offset)
+        != state.get("fingerprint")
+    ):
+        logger.info(
+            "Input %s was truncated or replaced;"
+            " recomputing", input_path
+        )
+        return None
+    return (
+        EventAggregate.from_state(state["aggregate"]),
+        offset,
+    )
+
+
+def save_checkpoint(
+    path: str,
+    input_path: str,
+    bounds: EpochRange,
+    aggregate: EventAggregate,
+    offset: int,
+) -> None:
+    """Write the checkpoint atomically, so a
+    crash never leaves a torn file."""
+    state = {
+        "version": CHECKPOINT_VERSION,
+        "start_us": bounds.start_us,
+        "end_us": bounds.end_us,
+        "offset": offset,
+        "fingerprint": _fingerprint(input_path, offset),
+        "aggregate": aggregate.to_state(),
+    }
+    with atomic_open(path) as f:
+        json.dump(state, f)
+
+
+class _Tail:
+    """Complete lines appended after
+    ``offset``, tracking how far they reach
+    and any unterminated last line."""
+
+    def __init__(self, f, offset: int, end: int):
+        self._f = f
+        self._end = end
+        self.offset = offset
+        self.partial = b""
+
+    def __iter__(self):
+        for line in iter_shard_lines(
+            self._f, self.offset, self._end
+        ):
+            if not line.endswith(b"\n"):
+                self.partial = line
+                return
+            self.offset += len(line)
+            if line.strip():
+                yield json.loads(line)
+
+
+def process_events_incremental(
+    input_path: str,
+    output_path: str,
+    start_date: datetime,
+    end_date: datetime,
+    output_format: str = "json",
+) -> dict:
+    """Process an append-only NDJSON event
+    file, resuming from the last checkpoint.
+
+    Only newline-terminated lines are
+    checkpointed. An unterminated last line
+    is counted in this run's summary if it
+    parses, and is read again next time.
+    """
+    bounds = EpochRange.from_datetimes(
+        start_date, end_date
+    )
+    ckpt = checkpoint_path(output_path)
+    resumed = load_checkpoint(ckpt, input_path, bounds)
+    aggregate, offset = resumed or (EventAggregate(), 0)
+    start_offset = offset
+
+    with open(input_path, "rb") as f:
+        tail = _Tail(
+            f, offset, os.path.getsize(input_path)
+        )
+        fold_events(tail, start_date, end_date, aggregate)
+    offset, partial = tail.offset, tail.partial
+    save_checkpoint(ckpt, input_path, bounds, aggregate, offset)
+
+    if partial.strip():
+        try:
+            event = json.loads(partial)
+        except ValueError:
+            logger.debug(
+                "Leaving partial last line of %s"
+                " for the next run", input_path
+            )
+        else:
+            aggregate = fold_events(
+                [event],
+                start_date,
+                end_date,
+                copy.deepcopy(aggregate),
+            )
+
+    logger.info(
+        "Read %d new bytes of %s (%s)",
+        offset - start_offset,
+        input_path,
+        "resumed" if resumed else "full run",
+    )
+    return finish_summary(
+        aggregate, output_path, output_format
+    )
@@ -0,0 +1,344 @@
+"""Fixed-memory approximate statistics for huge user populations.
+
+The exact ``per_user`` map grows with every distinct user. In
+approximate mode ``ApproxAggregate`` keeps:
+
+- a HyperLogLog sketch for ``unique_users`` (``2**precision`` bytes,
+  relative standard error ``1.04 / sqrt(2**precision)``),
+- a Space-Saving summary of the ``top_k`` heaviest users; each
+  reported count overestimates the true count by at most that entry's
+  ``max_overcount``, which never exceeds ``total_events / top_k``,
+- at most ``max_types`` event types per tracked user.
+
+``total_events`` and ``skipped_events`` stay exact. The error bounds
+are written into the summary under ``"approximation"``.
+"""
+
+import hashlib
+import heapq
+import itertools
+import json
+import math
+from datetime import datetime
+
+from event_io import open_events
+from event_stream import finish_summary, fold_events, iter_events
+
+HLL_PRECISION = 14
+TOP_K = 1000
+MAX_TYPES = 16
+
+
+# json.dumps(value) for str, without the
+# Python-level dumps overhead
+_encode_str = json.encoder.encode_basestring_ascii
+
+
+def _hash64(value) -> int:
+    """Stable 64-bit hash of ``value``'s JSON
+    encoding, identical across processes so
+    sketches can be merged. ``42`` and
+    ``"42"`` hash differently."""
+    text = (
+        _encode_str(value) if type(value) is str
+        else json.dumps(value)
+    )
+    return int.from_bytes(
+        hashlib.blake2b(
+            text.encode(), digest_size=8
+        ).digest(),
+        "big",
+    )
+
+
+def _order_key(item) -> tuple:
+    """Sort key for ids of mixed types."""
+    return type(item).__name__, item
+
+
+class HyperLogLog:
+    """Distinct-count sketch with
+    ``2**precision`` one-byte registers."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        if not 4 <= precision <= 18:
+            raise ValueError(
+                "precision must be between 4 and 18"
+            )
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def std_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value: str) -> None:
+        h = _hash64(value)
+        p = self.precision
+        idx = h >> (64 - p)
+        rest = h & ((1 << (64 - p)) - 1)
+        rank = (64 - p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError(
+                "cannot merge sketches of "
+                "different precision"
+            )
+        self.registers = bytearray(
+            map(max, self.registers, other.registers)
+        )
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(
+            2.0 ** -r for r in self.registers
+        )
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting for small
+            # cardinalities
+            raw = m * math.log(m / zeros)
+        return round(raw)
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in ``k`` counters.
+
+    Each tracked item carries ``count`` (an
+    overestimate) and ``error`` (the most it
+    can be over). Any item seen more than
+    ``n / k`` times is guaranteed tracked.
+    """
+
+    def __init__(self, k: int = TOP_K):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self.k = k
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        # (count, seq, item): seq breaks ties so
+        # ids of mixed types are never compared
+        self._heap: list[tuple[int, int, str]] = []
+        self._seq = itertools.count()
+
+    def add(self, item: str) -> str | None:
+        """Count one occurrence; return the
+        item evicted to make room, if any."""
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+            return None
+        if len(counts) < self.k:
+            counts[item] = 1
+            self.errors[item] = 0
+            heapq.heappush(
+                self._heap, (1, next(self._seq), item)
+            )
+            return None
+        victim, floor = self._pop_min()
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = floor + 1
+        self.errors[item] = floor
+        heapq.heappush(
+            self._heap, (floor + 1, next(self._seq), item)
+        )
+        return victim
+
+    def _pop_min(self) -> tuple[str, int]:
+        # Heap entries go stale as counts grow;
+        # refresh them lazily, and rebuild when
+        # stale entries pile up
+        heap, counts = self._heap, self.counts
+        if len(heap) > 4 * self.k:
+            heap[:] = [
+                (c, next(self._seq), i) for i, c in counts.items()
+            ]
+            heapq.heapify(heap)
+        while True:
+            count, _, item = heapq.heappop(heap)
+            current = counts.get(item)
+            if current == count:
+                return item, count
+            if current is not None:
+                heapq.heappush(
+                    heap, (current, next(self._seq), item)
+                )
+
+    def min_count(self) -> int:
+        """Lower bound on any untracked item's
+        omitted count when the summary is full."""
+        if len(self.counts) < self.k:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Mergeable-summaries union: items
+        missing on one side are charged that
+        side's minimum, then the top k are
+        kept."""
+        mine, theirs = self.min_count(), other.min_count()
+        merged = {}
+        for item in self.counts.keys() | other.counts.keys():
+            merged[item] = (
+                self.counts.get(item, mine)
+                + other.counts.get(item, theirs),
+                self.errors.get(item, mine)
+                + other.errors.get(item, theirs),
+            )
+        top = heapq.nlargest(
+            self.k, merged.items(), key=lambda kv: kv[1][0]
+        )
+        self.counts = {i: c for i, (c, _) in top}
+        self.errors = {i: e for i, (_, e) in top}
+        self._heap = [
+            (c, next(self._seq), i) for i, c in self.counts.items()
+        ]
+        heapq.heapify(self._heap)
+
+    def top(self) -> list[tuple[str, int, int]]:
+        """``(item, count, error)`` by
+        descending count."""
+        return sorted(
+            (
+                (i, c, self.errors[i])
+                for i, c in self.counts.items()
+            ),
+            key=lambda t: (-t[1], _order_key(t[0])),
+        )
+
+
+class ApproxAggregate:
+    """Fixed-memory stand-in for
+    ``EventAggregate``, with the same
+    ``add``/``skip``/``merge`` interface."""
+
+    def __init__(
+        self,
+        top_k: int = TOP_K,
+        precision: int = HLL_PRECISION,
+        max_types: int = MAX_TYPES,
+    ):
+        self.total_events = 0
+        self.skipped = 0
+        self.max_types = max_types
+        self.users = HyperLogLog(precision)
+        self.heavy = SpaceSaving(top_k)
+        self.types: dict[str, set] = {}
+        self.truncated: set[str] = set()
+
+    def add(self, event: dict) -> None:
+        uid = event["user_id"]
+        etype = event["type"]
+        self.total_events += 1
+        self.users.add(uid)
+        evicted = self.heavy.add(uid)
+        if evicted is not None:
+            self.types.pop(evicted, None)
+            self.truncated.discard(evicted)
+        types = self.types.setdefault(uid, set())
+        if etype in types:
+            return
+        if len(types) < self.max_types:
+            types.add(etype)
+        else:
+            self.truncated.add(uid)
+
+    def skip(self) -> None:
+        self.skipped += 1
+
+    def merge(
+        self, other: "ApproxAggregate"
+    ) -> "ApproxAggregate":
+        self.total_events += other.total_events
+        self.skipped += other.skipped
+        self.users.merge(other.users)
+        self.heavy.merge(other.heavy)
+        for uid in self.heavy.counts:
+            types = self.types.get(uid, set())
+            types |= other.types.get(uid, set())
+            if len(types) > self.max_types:
+                types = set(sorted(types)[:self.max_types])
+                self.truncated.add(uid)
+            self.types[uid] = types
+        self.truncated |= other.truncated
+        self.truncated &= self.heavy.counts.keys()
+        for uid in list(self.types):
+            if uid not in self.heavy.counts:
+                del self.types[uid]
+        return self
+
+    def to_summary(self) -> dict:
+        unique = self.users.estimate()
+        if self.total_events == 0:
+            unique = 0
+        avg = (
+            self.total_events / unique
+            if unique
+            else 0
+        )
+        top_users = [
+            {
+                "user_id": uid,
+                "count": count,
+                "max_overcount": error,
+                "types": sorted(self.types.get(uid, ())),
+                "types_truncated": (
+                    error > 0 or uid in self.truncated
+                ),
+            }
+            for uid, count, error in self.heavy.top()
+        ]
+        return {
+            "total_events": self.total_events,
+            "unique_users": unique,
+            "skipped_events": self.skipped,
+            "top_users": top_users,
+            "avg_events_per_user": round(avg, 2),
+            "approximation": {
+                "unique_users_std_error": round(
+                    self.users.std_error, 6
+                ),
+                "hll_precision": self.users.precision,
+                "top_k": self.heavy.k,
+                "max_overcount_bound": (
+                    self.total_events // self.heavy.k
+                ),
+                "max_types_per_user": self.max_types,
+            },
+        }
+
+
+def process_events_approximate(
+    input_path: str,
+    output_path: str,
+    start_date: datetime,
+    end_date: datetime,
+    input_format: str = "json",
+    top_k: int = TOP_K,
+    precision: int = HLL_PRECISION,
+    max_types: int = MAX_TYPES,
+    output_format: str = "json",
+    compression: str = "auto",
+) -> dict:
+    """Process user events in fixed memory.
+
+    The summary replaces ``per_user`` with
+    ``top_users`` and estimates
+    ``unique_users``; see the module
+    docstring for the error bounds.
+    """
+    with open_events(input_path, compression) as f:
+        aggregate = fold_events(
+            iter_events(f, input_format),
+            start_date,
+            end_date,
+            ApproxAggregate(top_k, precision, max_types),
+        )
+    return finish_summary(
+        aggregate, output_path, output_format
+    )
@@ -0,0 +1,279 @@
+"""Rate-limit algorithms with constant state per key.
+
+Listing 3.1 keeps every request timestamp per user and rebuilds that
+list on each request, so a check costs O(max_requests) time and memory.
+The algorithms here keep a few numbers per key and decide in O(1):
+
+- ``"sliding_window"``: two fixed-window counters, with the previous
+  window weighted by how much of it still overlaps the sliding window
+- ``"gcra"``: the generic cell rate algorithm, a single theoretical
+  arrival time per key
+- ``"token_bucket"``: ``max_requests`` tokens refilled evenly over
+  ``window_seconds``
+- ``"sliding_log"``: Listing 3.1's exact timestamp log, kept as the
+  reference behavior
+
+Each algorithm is a pure function of ``(state, now)``. ``check``
+returns a ``Decision`` holding the state to store if the request is
+allowed; a denied request changes nothing. Callers own the storage,
+which lets them check several limits before recording any of them.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Any
+
+# Slack for float rounding when adding up
+# emission intervals
+_EPSILON = 1e-9
+
+STRATEGIES = (
+    "sliding_window",
+    "gcra",
+    "token_bucket",
+    "sliding_log",
+)
+
+
+@dataclass(frozen=True)
+class Decision:
+    """Outcome of one check.
+
+    ``retry_after`` is the number of seconds
+    until a request would be allowed (0 when
+    allowed). ``state`` is what to store for
+    the key if the request goes ahead.
+    """
+
+    allowed: bool
+    remaining: int
+    retry_after: float
+    state: Any = None
+
+
+@dataclass(frozen=True)
+class SlidingWindowCounter:
+    """Approximate sliding window from two
+    fixed-window counts.
+
+    State: ``(window_index, previous, current)``.
+    """
+
+    max_requests: int
+    window_seconds: float
+
+    def check(self, state, now: float) -> Decision:
+        window = self.window_seconds
+        limit = self.max_requests
+        index = int(now // window)
+        if state is None or state[0] < index - 1:
+            prev, curr = 0, 0
+        elif state[0] == index - 1:
+            prev, curr = state[2], 0
+        else:
+            _, prev, curr = state
+        elapsed = now - index * window
+        weight = 1 - elapsed / window
+        used = prev * weight + curr
+        if used + 1 <= limit:
+            return Decision(
+                True,
+                int(limit - used - 1),
+                0.0,
+                (index, prev, curr + 1),
+            )
+        if curr + 1 > limit:
+            # Wait for the next window, then for
+            # this window's weight to fall enough
+            wait = (window - elapsed) + window * (
+                1 - (limit - 1) / curr
+            )
+        else:
+            wait = window * (
+                1 - (limit - 1 - curr) / prev
+            ) - elapsed
+        return Decision(False, 0, max(wait, 0.0), state)
+
+    def idle_at(self, state) -> float:
+        """Time from which ``state`` behaves
+        like no state at all."""
+        return (state[0] + 2) * self.window_seconds
+
+
+@dataclass(frozen=True)
+class GCRA:
+    """Generic cell rate algorithm.
+
+    One request is "emitted" every
+    ``window_seconds / max_requests``, with a
+    burst of up to ``max_requests``. State is
+    the theoretical arrival time (TAT) of the
+    next request.
+    """
+
+    max_requests: int
+    window_seconds: float
+
+    def check(self, state, now: float) -> Decision:
+        interval = self.window_seconds / self.max_requests
+        tat = now if state is None else max(state, now)
+        new_tat = tat + interval
+        ahead = new_tat - now
+        if ahead > self.window_seconds + _EPSILON:
+            return Decision(
+                False,
+                0,
+                ahead - self.window_seconds,
+                state,
+            )
+        remaining = int(
+            (self.window_seconds - ahead) / interval
+            + _EPSILON
+        )
+        return Decision(True, remaining, 0.0, new_tat)
+
+    def idle_at(self, state) -> float:
+        return state
+
+
+@dataclass(frozen=True)
+class TokenBucket:
+    """``max_requests`` tokens, refilled at
+    ``max_requests / window_seconds`` per
+    second.
+
+    State: ``(tokens, updated_at)``.
+    """
+
+    max_requests: int
+    window_seconds: float
+
+    def check(self, state, now: float) -> Decision:
+        capacity = self.max_requests
+        rate = capacity / self.window_seconds
+        if state is None:
+            tokens = float(capacity)
+        else:
+            tokens, updated = state
+            tokens = min(
+                capacity,
+                tokens + (now - updated) * rate,
+            )
+        if tokens >= 1:
+            tokens -= 1
+            return Decision(
+                True, int(tokens), 0.0, (tokens, now)
+            )
+        return Decision(
+            False, 0, (1 - tokens) / rate, state
+        )
+
+    def idle_at(self, state) -> float:
+        tokens, updated = state
+        rate = self.max_requests / self.window_seconds
+        return updated + (self.max_requests - tokens) / rate
+
+
+@dataclass(frozen=True)
+class SlidingLog:
+    """Listing 3.1's exact log of request
+    times; O(max_requests) per key.
+
+    State: a tuple of timestamps, oldest
+    first.
+    """
+
+    max_requests: int
+    window_seconds: float
+
+    def check(self, state, now: float) -> Decision:
+        cutoff = now - self.window_seconds
+        hits = tuple(t for t in state or () if t > cutoff)
+        if len(hits) >= self.max_requests:
+            oldest = hits[-self.max_requests]
+            return Decision(
+                False,
+                0,
+                oldest - cutoff,
+                hits,
+            )
+        return Decision(
+            True,
+            self.max_requests - len(hits) - 1,
+            0.0,
+            hits + (now,),
+        )
+
+    def idle_at(self, state) -> float:
+        if not state:
+            return -math.inf
+        return state[-1] + self.window_seconds
+
+
+def combine(decisions) -> Decision:
+    """One decision for several limits on
+    the same request: allowed only if every
+    limit allows, with the smallest
+    ``remaining`` and the longest wait.
+
+    ``state`` is a list of the individual
+    states, in order.
+    """
+    decisions = list(decisions)
+    allowed = all(d.allowed for d in decisions)
+    return Decision(
+        allowed,
+        min(d.remaining for d in decisions)
+        if allowed else 0,
+        max(d.retry_after for d in decisions),
+        [d.state for d in decisions],
+    )
+
+
+def rate_limit_headers(decision: Decision) -> dict:
+    """``X-RateLimit-Remaining`` and, when
+    denied, ``Retry-After`` in whole
+    seconds."""
+    headers = {
+        "X-RateLimit-Remaining": str(decision.remaining)
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(
+            max(1, math.ceil(decision.retry_after))
+        )
+    return headers
+
+
+_ALGORITHMS = {
+    "sliding_window": SlidingWindowCounter,
+    "gcra": GCRA,
+    "token_bucket": TokenBucket,
+    "sliding_log": SlidingLog,
+}
+
+
+def make_algorithm(
+    strategy: str,
+    max_requests: int,
+    window_seconds: float,
+):
+    """Build the algorithm named by
+    ``strategy``.
+
+    Raises:
+        ValueError: for an unknown strategy
+            or a non-positive limit or window
+    """
+    try:
+        cls = _ALGORITHMS[strategy]
+    except KeyError:
+        raise ValueError(
+            f"Unknown strategy: {strategy!r} "
+            f"(expected one of {STRATEGIES})"
+        ) from None
+    if max_requests < 1 or window_seconds <= 0:
+        raise ValueError(
+            "max_requests and window_seconds "
+            "must be positive"
+        )
+    return cls(max_requests, window_seconds)
@@ -0,0 +1,150 @@
+"""Exact sliding-window limiter on preallocated ring buffers.
+
+When Listing 3.1's exact semantics must stay, its ``list[float]`` per
+user is still rebuilt, and so reallocated, on every request.
+``RingBufferLimiter`` keeps the same log in one preallocated
+``array('d')`` of ``max_keys * max_requests`` timestamps. Each user
+owns a slot of ``max_requests`` entries used as a ring: the entry at
+the ring's head is the oldest of the last ``max_requests`` requests,
+so a check reads that one entry and, if allowed, overwrites it. Nothing
+is allocated per request, and decisions match ``"sliding_log"``
+exactly.
+
+Slots are handed out in least-recently-used order. A new user takes a
+free slot, or that of the least recently used user. Reusing a slot
+whose window has passed counts as an expiration; reusing one that was
+still active counts as an eviction.
+"""
+
+import math
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable
+
+from limiter_algorithms import Decision
+from limiter_store import StoreStats
+
+MAX_KEYS = 10_000
+
+
+class RingBufferLimiter:
+    """Exact sliding-window limiter with a
+    fixed block of timestamps.
+
+    Memory is ``8 * max_keys * max_requests``
+    bytes, allocated up front.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = 100,
+        window_seconds: float = 60,
+        max_keys: int = MAX_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_requests < 1 or window_seconds <= 0:
+            raise ValueError(
+                "max_requests and window_seconds "
+                "must be positive"
+            )
+        if max_keys < 1:
+            raise ValueError("max_keys must be at least 1")
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.clock = clock
+        self._empty = array("d", [-math.inf]) * max_requests
+        self._times = self._empty * max_keys
+        self._heads = array("l", [0]) * max_keys
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        self._free = list(range(max_keys - 1, -1, -1))
+        self._stats = StoreStats()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def stats(self) -> StoreStats:
+        self._stats.resident_keys = len(self._slots)
+        return self._stats
+
+    def _slot(self, key: str, now: float) -> int:
+        slots = self._slots
+        slot = slots.get(key)
+        if slot is not None:
+            slots.move_to_end(key)
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            _, slot = slots.popitem(last=False)
+            if self._newest(slot) > now - self.window_seconds:
+                self._stats.evictions += 1
+            else:
+                self._stats.expirations += 1
+            base = slot * self.max_requests
+            self._times[base:base + self.max_requests] = (
+                self._empty
+            )
+            self._heads[slot] = 0
+        slots[key] = slot
+        return slot
+
+    def _newest(self, slot: int) -> float:
+        n = self.max_requests
+        head = self._heads[slot]
+        return self._times[slot * n + (head - 1) % n]
+
+    def _count_after(
+        self, base: int, head: int, cutoff: float
+    ) -> int:
+        """Entries newer than ``cutoff``; the
+        ring is oldest-first from ``head``, so
+        binary search it."""
+        n = self.max_requests
+        times = self._times
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[base + (head + mid) % n] > cutoff:
+                hi = mid
+            else:
+                lo = mid + 1
+        return n - lo
+
+    def hit(self, key: str) -> Decision:
+        """Check ``key`` and record the
+        request if it is allowed."""
+        now = self.clock()
+        cutoff = now - self.window_seconds
+        slot = self._slot(key, now)
+        n = self.max_requests
+        base = slot * n
+        head = self._heads[slot]
+        oldest = self._times[base + head]
+        if oldest > cutoff:
+            return Decision(False, 0, oldest - cutoff)
+        used = self._count_after(base, head, cutoff)
+        self._times[base + head] = now
+        self._heads[slot] = (head + 1) % n
+        return Decision(True, n - used - 1, 0.0)
+
+    def sweep(self, now: float) -> int:
+        """Free the slots of users whose window
+        has passed; return how many."""
+        cutoff = now - self.window_seconds
+        idle = [
+            key for key, slot in self._slots.items()
+            if self._newest(slot) <= cutoff
+        ]
+        for key in idle:
+            slot = self._slots.pop(key)
+            base = slot * self.max_requests
+            self._times[base:base + self.max_requests] = (
+                self._empty
+            )
+            self._heads[slot] = 0
+            self._free.append(slot)
+        self._stats.expirations += len(idle)
+        return len(idle)
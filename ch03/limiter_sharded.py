@@ -0,0 +1,102 @@
+"""Lock-striped limiter store for multi-threaded servers.
+
+Listing 3.1's read-filter-append on ``_hits`` is only safe while one
+event loop in one thread touches it. Sync endpoints run in a thread
+pool, and threaded workers share the module, so two requests for the
+same user can interleave and both slip under the limit. A single global
+lock fixes that but makes every request in the process queue behind
+it.
+
+``ShardedStore`` splits keys over ``shards`` independent
+``BoundedStore`` instances by ``hash(key)``, each with its own lock.
+Only requests for keys in the same shard contend. The lock is held
+just for one synchronous check, with no ``await`` inside, so the store
+is also safe to call from coroutines. Under the GIL striping mostly
+avoids lock convoys; on free-threaded builds shards run in parallel.
+
+``bench_limiter_contention.py`` compares shard counts under load.
+"""
+
+import os
+import threading
+
+from limiter_algorithms import Decision
+from limiter_store import (
+    MAX_KEYS,
+    SWEEP_BATCH,
+    BoundedStore,
+    StoreStats,
+)
+
+
+def default_shards() -> int:
+    """Next power of two at or above four
+    shards per CPU."""
+    return 1 << (4 * (os.cpu_count() or 1) - 1).bit_length()
+
+
+class ShardedStore:
+    """``shards`` locked ``BoundedStore``s;
+    ``max_keys`` is split evenly between
+    them."""
+
+    def __init__(
+        self,
+        shards: int | None = None,
+        max_keys: int = MAX_KEYS,
+        sweep_batch: int = SWEEP_BATCH,
+    ):
+        if shards is None:
+            shards = default_shards()
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        per_shard = max(1, -(-max_keys // shards))
+        self._shards = [
+            BoundedStore(per_shard, sweep_batch)
+            for _ in range(shards)
+        ]
+        self._locks = [
+            threading.Lock() for _ in range(shards)
+        ]
+
+    def __len__(self) -> int:
+        return sum(map(len, self._shards))
+
+    def _index(self, key: str) -> int:
+        return hash(key) % len(self._shards)
+
+    @property
+    def stats(self) -> StoreStats:
+        total = StoreStats()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                s = shard.stats
+                total.resident_keys += s.resident_keys
+                total.evictions += s.evictions
+                total.expirations += s.expirations
+        return total
+
+    def get(self, key: str, now: float):
+        i = self._index(key)
+        with self._locks[i]:
+            return self._shards[i].get(key, now)
+
+    def apply(
+        self, key: str, algorithm, now: float
+    ) -> Decision:
+        """``BoundedStore.apply`` under the
+        key's shard lock."""
+        i = self._index(key)
+        with self._locks[i]:
+            return self._shards[i].apply(
+                key, algorithm, now
+            )
+
+    def sweep(self, now: float) -> int:
+        """Sweep each shard in turn, holding
+        one lock at a time."""
+        removed = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                removed += shard.sweep(now)
+        return removed
@@ -0,0 +1,142 @@
+"""Bounded per-key state storage for the in-memory rate limiter.
+
+Listing 3.1's ``_hits`` is a ``defaultdict`` that never forgets a user,
+so memory grows with every user ever seen. ``BoundedStore`` keeps at
+most ``max_keys`` entries in least-recently-used order and drops state
+that has gone idle, i.e. state that would decide exactly like no state
+at all:
+
+- reads treat an idle entry as missing and remove it,
+- every write also sweeps up to ``sweep_batch`` entries from the
+  least-recently-used end, stopping at the first one still active, so
+  cleanup costs O(1) amortized and needs no extra thread,
+- ``sweep()`` scans everything, for an optional periodic task,
+- past ``max_keys`` the least recently used key is evicted. An evicted
+  user that was still being limited starts over with a fresh limit.
+
+``StoreStats`` counts evictions and expirations and reports how many
+keys are resident.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from limiter_algorithms import Decision
+
+MAX_KEYS = 100_000
+SWEEP_BATCH = 8
+
+
+@dataclass
+class StoreStats:
+    """Counters for one store."""
+
+    resident_keys: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "resident_keys": self.resident_keys,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class BoundedStore:
+    """LRU map of ``key -> (state, idle_at)``
+    with idle-key expiry.
+
+    Not thread-safe; callers serialize
+    access.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = MAX_KEYS,
+        sweep_batch: int = SWEEP_BATCH,
+    ):
+        if max_keys < 1:
+            raise ValueError("max_keys must be at least 1")
+        self.max_keys = max_keys
+        self.sweep_batch = sweep_batch
+        self._entries: OrderedDict = OrderedDict()
+        self._stats = StoreStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> StoreStats:
+        self._stats.resident_keys = len(self._entries)
+        return self._stats
+
+    def get(self, key: str, now: float):
+        """State for ``key``, or None if it is
+        missing or idle at ``now``."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._entries[key]
+            self._stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(
+        self,
+        key: str,
+        state,
+        idle_at: float,
+        now: float,
+    ) -> None:
+        """Store ``state`` until ``idle_at``,
+        sweeping and evicting as needed."""
+        entries = self._entries
+        entries[key] = (state, idle_at)
+        entries.move_to_end(key)
+        self._sweep_front(now, self.sweep_batch)
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+            self._stats.evictions += 1
+
+    def apply(
+        self, key: str, algorithm, now: float
+    ) -> Decision:
+        """Check ``key`` with ``algorithm`` and
+        store the new state if allowed."""
+        decision = algorithm.check(self.get(key, now), now)
+        if decision.allowed:
+            self.set(
+                key,
+                decision.state,
+                algorithm.idle_at(decision.state),
+                now,
+            )
+        return decision
+
+    def _sweep_front(self, now: float, limit: int) -> int:
+        entries = self._entries
+        removed = 0
+        while removed < limit and entries:
+            key, (_, idle_at) = next(iter(entries.items()))
+            if idle_at > now:
+                break
+            del entries[key]
+            removed += 1
+        self._stats.expirations += removed
+        return removed
+
+    def sweep(self, now: float) -> int:
+        """Remove every idle entry; return how
+        many were removed."""
+        idle = [
+            key
+            for key, (_, idle_at) in self._entries.items()
+            if idle_at <= now
+        ]
+        for key in idle:
+            del self._entries[key]
+        self._stats.expirations += len(idle)
+        return len(idle)
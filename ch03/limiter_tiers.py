@@ -0,0 +1,203 @@
+"""Multi-tier rate limits evaluated in one pass, with response headers.
+
+A request often has to pass several limits: per user, per route, per
+tenant and a global cap. Checking them one by one costs a round trip
+each and can record a request against the first tiers even though a
+later tier rejects it. Here all tiers are decided together, and a
+request is recorded against all of them or none:
+
+- ``MultiTierLimiter`` does it in one in-memory pass under one lock,
+- ``RedisTierLimiter`` does it in one Redis script call.
+
+``tiered_rate_limit_middleware`` works with either. It answers 429
+with ``Retry-After`` and sets ``X-RateLimit-Remaining`` (the tightest
+tier's) on every response, so clients can back off instead of retrying
+blindly.
+"""
+
+import inspect
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+import redis.asyncio as redis
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from limiter_algorithms import (
+    Decision,
+    combine,
+    make_algorithm,
+    rate_limit_headers,
+)
+from limiter_store import MAX_KEYS, BoundedStore
+from redis_rate_limiter import (
+    KEY_PREFIX,
+    _redis,
+    check_rate_limit_tiers,
+)
+
+
+@dataclass(frozen=True)
+class Tier:
+    """One limit, applied per value of
+    ``key(request)``."""
+
+    name: str
+    max_requests: int
+    window_seconds: float
+    key: Callable[[Request], str]
+
+    def key_for(self, request: Request) -> str:
+        # The limit is part of the key, so two
+        # tiers on the same key (burst plus
+        # sustained) keep separate state
+        return (
+            f"{self.name}:{self.max_requests}/"
+            f"{self.window_seconds:g}:{self.key(request)}"
+        )
+
+
+def per_user(max_requests: int, window_seconds: float) -> Tier:
+    return Tier(
+        "user", max_requests, window_seconds,
+        lambda r: r.state.user_id,
+    )
+
+
+def per_tenant(max_requests: int, window_seconds: float) -> Tier:
+    return Tier(
+        "tenant", max_requests, window_seconds,
+        lambda r: r.state.tenant_id,
+    )
+
+
+def per_route(max_requests: int, window_seconds: float) -> Tier:
+    return Tier(
+        "route", max_requests, window_seconds,
+        lambda r: f"{r.method} {r.url.path}",
+    )
+
+
+def global_limit(
+    max_requests: int, window_seconds: float
+) -> Tier:
+    return Tier(
+        "global", max_requests, window_seconds,
+        lambda r: "*",
+    )
+
+
+class MultiTierLimiter:
+    """All tiers checked in one in-memory
+    pass."""
+
+    def __init__(
+        self,
+        tiers: Sequence[Tier],
+        strategy: str = "sliding_window",
+        clock: Callable[[], float] = time.monotonic,
+        max_keys: int = MAX_KEYS,
+    ):
+        if not tiers:
+            raise ValueError("at least one tier is required")
+        self.tiers = list(tiers)
+        self.algorithms = [
+            make_algorithm(
+                strategy, t.max_requests, t.window_seconds
+            )
+            for t in self.tiers
+        ]
+        self.clock = clock
+        self.store = BoundedStore(max_keys)
+        self._lock = threading.Lock()
+
+    def hit(self, keys: Sequence[str]) -> Decision:
+        """Check one request against each
+        tier's key (in tier order); record it
+        only if every tier allows it.
+
+        Raises:
+            ValueError: if two tiers share a key
+        """
+        if len(set(keys)) != len(keys):
+            raise ValueError("tiers must use distinct keys")
+        store = self.store
+        with self._lock:
+            now = self.clock()
+            decisions = [
+                algorithm.check(store.get(key, now), now)
+                for key, algorithm in zip(keys, self.algorithms)
+            ]
+            decision = combine(decisions)
+            if decision.allowed:
+                for key, algorithm, d in zip(
+                    keys, self.algorithms, decisions
+                ):
+                    store.set(
+                        key,
+                        d.state,
+                        algorithm.idle_at(d.state),
+                        now,
+                    )
+        return decision
+
+    def check(self, request: Request) -> Decision:
+        return self.hit(
+            [t.key_for(request) for t in self.tiers]
+        )
+
+
+class RedisTierLimiter:
+    """All tiers checked in one Redis script
+    call."""
+
+    def __init__(
+        self,
+        tiers: Sequence[Tier],
+        client: redis.Redis | None = None,
+        strategy: str = "sliding_window",
+    ):
+        if not tiers:
+            raise ValueError("at least one tier is required")
+        self.tiers = list(tiers)
+        self.client = client or _redis
+        self.strategy = strategy
+
+    async def check(self, request: Request) -> Decision:
+        return await check_rate_limit_tiers(
+            [
+                (
+                    KEY_PREFIX + t.key_for(request),
+                    t.max_requests,
+                    t.window_seconds,
+                )
+                for t in self.tiers
+            ],
+            self.client,
+            self.strategy,
+        )
+
+
+def tiered_rate_limit_middleware(
+    limiter: MultiTierLimiter | RedisTierLimiter,
+):
+    """FastAPI middleware enforcing every
+    tier of ``limiter``, with rate-limit
+    headers."""
+    async def middleware(request: Request, call_next):
+        decision = limiter.check(request)
+        if inspect.isawaitable(decision):
+            decision = await decision
+        headers = rate_limit_headers(decision)
+        if not decision.allowed:
+            return JSONResponse(
+                {"detail": "Rate limit exceeded"},
+                status_code=429,
+                headers=headers,
+            )
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+    return middleware
@@ -0,0 +1,101 @@
+"""In-memory FastAPI rate limiter with O(1) state per user.
+
+A drop-in for Listing 3.1's ``rate_limit`` decorator with the same
+429 response, plus a ``strategy=`` argument choosing one of the
+algorithms in ``limiter_algorithms``. Each decorated endpoint gets its
+own ``InMemoryLimiter``, so endpoints with different limits no longer
+share one ``_hits`` map. A 429 carries ``Retry-After`` and
+``X-RateLimit-Remaining`` headers. State lives in a ``BoundedStore``, so idle
+users are forgotten and memory stays capped at ``max_keys`` users.
+"""
+
+import time
+from functools import wraps
+from typing import Callable
+
+from fastapi import HTTPException, Request
+
+from limiter_algorithms import (
+    Decision,
+    make_algorithm,
+    rate_limit_headers,
+)
+from limiter_store import MAX_KEYS, BoundedStore
+
+
+class InMemoryLimiter:
+    """One algorithm plus a bounded per-key
+    state store.
+
+    ``store`` defaults to a ``BoundedStore``;
+    pass a ``limiter_sharded.ShardedStore``
+    when threads share the limiter.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = 100,
+        window_seconds: float = 60,
+        strategy: str = "sliding_window",
+        clock: Callable[[], float] = time.monotonic,
+        max_keys: int = MAX_KEYS,
+        store=None,
+    ):
+        self.algorithm = make_algorithm(
+            strategy, max_requests, window_seconds
+        )
+        self.clock = clock
+        if store is None:
+            store = BoundedStore(max_keys)
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def hit(self, key: str) -> Decision:
+        """Check ``key`` and record the
+        request if it is allowed."""
+        return self.store.apply(
+            key, self.algorithm, self.clock()
+        )
+
+
+def rate_limit(
+    max_requests: int = 100,
+    window_seconds: float = 60,
+    strategy: str = "sliding_window",
+    limiter=None,
+):
+    """Rate-limit decorator for FastAPI.
+
+    Pass ``limiter`` to share one limiter
+    between endpoints or to inspect it; any
+    object with ``hit(key) -> Decision``
+    works, e.g. ``limiter_ring``'s
+    ``RingBufferLimiter``.
+    """
+    if limiter is None:
+        limiter = InMemoryLimiter(
+            max_requests, window_seconds, strategy
+        )
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(
+            request: Request,
+            *args, **kwargs
+        ):
+            user = request.state.user_id
+            decision = limiter.hit(user)
+            if not decision.allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Rate limit exceeded",
+                    headers=rate_limit_headers(decision),
+                )
+            return await func(
+                request, *args, **kwargs
+            )
+        wrapper.limiter = limiter
+        return wrapper
+    return decorator
@@ -0,0 +1,198 @@
+"""Circuit breaker and in-process fallback for the Redis limiter.
+
+When Redis is down or slow, every check in Listing 3.2 waits for it
+and then fails. ``ResilientRateLimiter`` wraps ``check_rate_limit``
+in a ``CircuitBreaker``:
+
+- closed: checks go to Redis. ``failure_threshold`` consecutive
+  errors or timeouts open the breaker.
+- open: Redis is skipped and the ``fallback`` decides. After
+  ``reset_timeout`` seconds one probe request is sent to Redis.
+- half-open: while the probe runs, other checks use the fallback. A
+  successful probe closes the breaker; a failed or cancelled one
+  reopens it. A probe that never reports back is given up after
+  another ``reset_timeout`` and a new one is sent.
+
+``fallback`` is one of:
+
+- ``"memory"``: a per-process ``InMemoryLimiter`` with the same limit.
+  Each instance enforces the full limit on its own, so the total
+  across N instances can reach N times the limit during an outage.
+- ``"open"``: allow every request (fail open).
+- ``"closed"``: reject every request (fail closed).
+
+Every breaker transition is logged at WARNING, counted in
+``FallbackStats`` and passed to ``on_change`` listeners, so alerts can
+fire on mode switches.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from rate_limiter import InMemoryLimiter
+from redis_rate_limiter import _redis, check_rate_limit
+
+logger = logging.getLogger(__name__)
+
+FALLBACKS = ("memory", "open", "closed")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    ``on_change(old, new)`` listeners run on
+    every state transition.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.listeners: list[Callable[[str, str], None]] = []
+
+    def allow(self) -> bool:
+        """Whether the next call should try
+        the protected service."""
+        if self.state == CLOSED:
+            return True
+        now = self.clock()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        # Also reached when a half-open probe
+        # never recorded its outcome
+        self.opened_at = now
+        if self.state != HALF_OPEN:
+            self._switch(HALF_OPEN)
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != CLOSED:
+            self._switch(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if (
+            self.state == HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            self.opened_at = self.clock()
+            if self.state != OPEN:
+                self._switch(OPEN)
+
+    def _switch(self, state: str) -> None:
+        old, self.state = self.state, state
+        for listener in self.listeners:
+            listener(old, state)
+
+
+@dataclass
+class FallbackStats:
+    """Counters for one
+    ``ResilientRateLimiter``."""
+
+    redis_checks: int = 0
+    fallback_checks: int = 0
+    redis_errors: int = 0
+    mode_switches: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "redis_checks": self.redis_checks,
+            "fallback_checks": self.fallback_checks,
+            "redis_errors": self.redis_errors,
+            "mode_switches": self.mode_switches,
+        }
+
+
+class ResilientRateLimiter:
+    """``check_rate_limit`` behind a circuit
+    breaker with a configurable fallback."""
+
+    def __init__(
+        self,
+        client: redis.Redis | None = None,
+        max_requests: int = 100,
+        window_seconds: float = 60,
+        strategy: str = "sliding_window",
+        fallback: str = "memory",
+        breaker: CircuitBreaker | None = None,
+    ):
+        if fallback not in FALLBACKS:
+            raise ValueError(
+                f"Unknown fallback: {fallback!r} "
+                f"(expected one of {FALLBACKS})"
+            )
+        self.client = client or _redis
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.strategy = strategy
+        self.fallback = fallback
+        self.breaker = breaker or CircuitBreaker()
+        self.breaker.listeners.append(self._on_change)
+        self.stats = FallbackStats()
+        self.memory = InMemoryLimiter(
+            max_requests, window_seconds, strategy
+        )
+
+    @property
+    def mode(self) -> str:
+        """``"redis"`` or ``"fallback"``."""
+        if self.breaker.state == CLOSED:
+            return "redis"
+        return "fallback"
+
+    def _on_change(self, old: str, new: str) -> None:
+        self.stats.mode_switches += 1
+        logger.warning(
+            "Rate limiter circuit %s -> %s "
+            "(fallback: %s)",
+            old, new, self.fallback,
+        )
+
+    async def check(self, user_id: str) -> bool:
+        """Check and record a request."""
+        if self.breaker.allow():
+            try:
+                allowed = await check_rate_limit(
+                    user_id,
+                    self.max_requests,
+                    self.window_seconds,
+                    self.client,
+                    self.strategy,
+                )
+            except (RedisError, OSError) as e:
+                self.stats.redis_errors += 1
+                logger.debug("Redis check failed: %r", e)
+                self.breaker.record_failure()
+            except BaseException:
+                # Cancelled or unexpected: a probe
+                # must not stay in flight forever
+                if self.breaker.state == HALF_OPEN:
+                    self.breaker.record_failure()
+                raise
+            else:
+                self.stats.redis_checks += 1
+                self.breaker.record_success()
+                return allowed
+        self.stats.fallback_checks += 1
+        if self.fallback == "memory":
+            return self.memory.hit(user_id).allowed
+        return self.fallback == "open"
@@ -0,0 +1,284 @@
+"""Local token leasing in front of the Redis rate limiter.
+
+With Listing 3.2 every request waits on one Redis round trip. Here each
+app instance leases a block of up to ``lease_size`` tokens per key from
+a token bucket in Redis, with one atomic script call, and answers
+requests from local memory until the block runs out or ``lease_ttl``
+passes. Leftover tokens go back to the bucket with the next lease call
+for that key, from ``release_expired()``, or from ``close()``.
+
+Lease entries, denials included, are kept in lease order. Each new
+lease also drops up to ``SWEEP_BATCH`` expired entries from the oldest
+end and returns their tokens, so the map tracks recently active keys,
+not every key ever seen, without a periodic task.
+
+Tokens are only ever taken from the shared bucket, so all instances
+together never admit more than the limit. The cost is under-admission:
+tokens one instance holds are unusable by others until returned. Lower
+``lease_size`` and ``lease_ttl`` trade round trips for accuracy;
+``lease_size=1`` behaves like a plain token bucket in Redis with a
+round trip per request. When the bucket is empty, the denial is cached
+locally for one refill interval so rejected clients do not reach Redis
+either.
+
+Concurrent requests for a key with no tokens share one lease call.
+``LeaseStats.hit_rate`` is the fraction of checks answered without
+waiting on Redis.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+import redis.asyncio as redis
+
+from limiter_store import SWEEP_BATCH
+from redis_rate_limiter import (
+    LuaScript,
+    _redis,
+    make_rate_limit_middleware,
+)
+
+KEY_PREFIX = "lease:"
+LEASE_SIZE = 10
+LEASE_TTL = 1.0
+
+# Token bucket stored as a hash. Returned
+# tokens are added back first, then up to
+# ARGV[4] whole tokens are granted.
+LEASE_SCRIPT = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local want = tonumber(ARGV[4])
+local returned = tonumber(ARGV[5])
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1])
+if tokens == nil then
+    tokens = capacity
+else
+    local elapsed = math.max(0, now - tonumber(state[2]))
+    tokens = tokens + elapsed * capacity / window
+end
+tokens = math.min(capacity, tokens + returned)
+local grant = math.min(math.floor(tokens), want)
+tokens = tokens - grant
+redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(window * 1000))
+return grant
+"""
+
+_lease_script = LuaScript(LEASE_SCRIPT)
+
+
+@dataclass
+class LeaseStats:
+    """Counters for one ``LeasedRateLimiter``."""
+
+    checks: int = 0
+    local_hits: int = 0
+    local_denials: int = 0
+    round_trips: int = 0
+    tokens_leased: int = 0
+    tokens_returned: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Checks answered from local memory."""
+        if not self.checks:
+            return 0.0
+        local = self.local_hits + self.local_denials
+        return local / self.checks
+
+    def as_dict(self) -> dict:
+        return {
+            "checks": self.checks,
+            "local_hits": self.local_hits,
+            "local_denials": self.local_denials,
+            "round_trips": self.round_trips,
+            "tokens_leased": self.tokens_leased,
+            "tokens_returned": self.tokens_returned,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+@dataclass
+class _Lease:
+    tokens: int
+    expires_at: float
+    dry: bool = False
+
+
+class LeasedRateLimiter:
+    """Rate limiter serving requests from
+    tokens leased out of Redis."""
+
+    def __init__(
+        self,
+        client: redis.Redis | None = None,
+        max_requests: int = 100,
+        window_seconds: float = 60,
+        lease_size: int = LEASE_SIZE,
+        lease_ttl: float = LEASE_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        if lease_size < 1 or lease_ttl <= 0:
+            raise ValueError(
+                "lease_size and lease_ttl must be "
+                "positive"
+            )
+        self.client = client or _redis
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        self.stats = LeaseStats()
+        self._leases: OrderedDict[str, _Lease] = OrderedDict()
+        self._pending: dict[str, asyncio.Future] = {}
+
+    async def check(self, user_id: str) -> bool:
+        """Check and record a request."""
+        key = KEY_PREFIX + user_id
+        self.stats.checks += 1
+        while True:
+            lease = self._leases.get(key)
+            if lease is not None and (
+                lease.expires_at > self.clock()
+            ):
+                if lease.tokens:
+                    lease.tokens -= 1
+                    self.stats.local_hits += 1
+                    return True
+                if lease.dry:
+                    self.stats.local_denials += 1
+                    return False
+            lease = await self._renew(key)
+            if lease.tokens:
+                lease.tokens -= 1
+                return True
+            if lease.dry:
+                return False
+            # Other waiters drained the new
+            # lease first; lease again
+
+    async def _renew(self, key: str) -> _Lease:
+        """Lease for ``key``, sharing one
+        in-flight call between waiters."""
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lease(key))
+            self._pending[key] = task
+            task.add_done_callback(
+                lambda _: self._pending.pop(key, None)
+            )
+        return await asyncio.shield(task)
+
+    def _expired_front(self, now: float, skip: str) -> list[str]:
+        """Up to ``SWEEP_BATCH`` expired keys
+        from the oldest end, stopping at the
+        first live lease."""
+        expired = []
+        for key, lease in self._leases.items():
+            if len(expired) == SWEEP_BATCH or lease.expires_at > now:
+                break
+            if key != skip and key not in self._pending:
+                expired.append(key)
+        return expired
+
+    async def _lease(self, key: str) -> _Lease:
+        old = self._leases.get(key)
+        returned = 0
+        if old is not None:
+            returned, old.tokens = old.tokens, 0
+        now = self.clock()
+        swept = self._expired_front(now, key)
+        if swept:
+            await self._release(swept, now)
+        grant = await _lease_script(
+            self.client,
+            [key],
+            [
+                self.max_requests,
+                self.window_seconds,
+                now,
+                self.lease_size,
+                returned,
+            ],
+        )
+        self.stats.round_trips += 1
+        self.stats.tokens_leased += grant
+        self.stats.tokens_returned += returned
+        if grant:
+            lease = _Lease(grant, now + self.lease_ttl)
+        else:
+            # Cache the denial until about one
+            # token has refilled
+            refill = self.window_seconds / self.max_requests
+            lease = _Lease(
+                0, now + min(refill, self.lease_ttl), dry=True
+            )
+        self._leases[key] = lease
+        self._leases.move_to_end(key)
+        return lease
+
+    async def release_expired(self) -> int:
+        """Return leftover tokens of expired
+        leases in one round trip and forget
+        those keys; returns how many keys."""
+        now = self.clock()
+        expired = [
+            key for key, lease in self._leases.items()
+            if lease.expires_at <= now
+            and key not in self._pending
+        ]
+        await self._release(expired, now)
+        return len(expired)
+
+    async def close(self) -> None:
+        """Return every unused token, e.g. on
+        shutdown."""
+        await self._release(
+            [
+                key for key in self._leases
+                if key not in self._pending
+            ],
+            self.clock(),
+        )
+
+    async def _release(
+        self, keys: list[str], now: float
+    ) -> None:
+        leases = [self._leases.pop(key) for key in keys]
+        calls = [
+            (
+                [key],
+                [
+                    self.max_requests,
+                    self.window_seconds,
+                    now,
+                    0,
+                    lease.tokens,
+                ],
+            )
+            for key, lease in zip(keys, leases)
+            if lease.tokens
+        ]
+        if not calls:
+            return
+        await _lease_script.run_many(self.client, calls)
+        self.stats.round_trips += 1
+        self.stats.tokens_returned += sum(
+            c[1][4] for c in calls
+        )
+
+
+def leased_rate_limit_middleware(
+    limiter: LeasedRateLimiter,
+):
+    """Listing 3.2's middleware, checking
+    through ``limiter``."""
+    return make_rate_limit_middleware(limiter.check)
@@ -0,0 +1,430 @@
+"""Redis rate limiter with cached scripts and pipelined batch checks.
+
+Listing 3.2 calls ``EVAL`` with the full script source on every
+request, so Redis receives and hashes the script text each time. Here
+each script's SHA1 is computed once and requests use ``EVALSHA``. If
+Redis answers ``NOSCRIPT`` (after a restart, failover or
+``SCRIPT FLUSH``), the script is loaded and the call retried.
+
+``check_rate_limits`` checks many ``(key, max_requests,
+window_seconds)`` limits in one pipelined round trip, for gateways
+that check several limits per request.
+
+The default client comes from ``make_client``: a blocking connection
+pool of bounded size with connect, command and pool-wait timeouts, so
+a slow Redis fails fast instead of stalling requests.
+``redis_fallback`` adds a circuit breaker on top.
+
+``strategy`` picks the script. Listing 3.2's ``"sliding_log"`` stores
+one sorted-set member per request, so memory grows with
+``max_requests``, and requests with the same timestamp collide on one
+member. The default ``"sliding_window"`` keeps two integer counters per
+key (this window and the last), and ``"gcra"`` keeps one timestamp.
+Both decide exactly like the in-memory algorithms of the same name in
+``limiter_algorithms``. Their scripts also check several limits at
+once: ``check_rate_limit_tiers`` records a request against every tier
+in one atomic call, or against none of them. ``rate_limit_middleware``
+answers 429 with ``Retry-After`` and sets ``X-RateLimit-Remaining``
+from the script's decision.
+"""
+
+import hashlib
+import time
+from typing import Awaitable, Callable, Iterable, Sequence
+
+import redis.asyncio as redis
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from redis.exceptions import NoScriptError
+
+from limiter_algorithms import Decision, rate_limit_headers
+
+REDIS_URL = "redis://localhost:6379"
+
+KEY_PREFIX = "rate:"
+
+
+def make_client(
+    url: str = REDIS_URL,
+    max_connections: int = 50,
+    pool_timeout: float = 0.1,
+    connect_timeout: float = 0.1,
+    command_timeout: float = 0.05,
+) -> redis.Redis:
+    """Redis client with an explicitly sized
+    pool and timeouts in seconds.
+
+    ``pool_timeout`` bounds the wait for a
+    free connection when all
+    ``max_connections`` are busy.
+    """
+    pool = redis.BlockingConnectionPool.from_url(
+        url,
+        max_connections=max_connections,
+        timeout=pool_timeout,
+        socket_connect_timeout=connect_timeout,
+        socket_timeout=command_timeout,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+_redis = make_client()
+
+# Listing 3.2's script
+SLIDING_LOG_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE',
+    key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count >= limit then
+    return 0
+end
+redis.call('ZADD', key, now, now)
+redis.call('EXPIRE', key, window)
+return 1
+"""
+
+
+class LuaScript:
+    """A Lua script called by SHA, loaded
+    into Redis on ``NOSCRIPT``."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    async def __call__(
+        self,
+        client: redis.Redis,
+        keys: Sequence[str],
+        args: Sequence,
+    ):
+        try:
+            return await client.evalsha(
+                self.sha, len(keys), *keys, *args
+            )
+        except NoScriptError:
+            await client.script_load(self.source)
+            return await client.evalsha(
+                self.sha, len(keys), *keys, *args
+            )
+
+    async def run_many(
+        self,
+        client: redis.Redis,
+        calls: Sequence[tuple[Sequence[str], Sequence]],
+    ) -> list:
+        """Run ``(keys, args)`` calls in one
+        pipelined round trip.
+
+        Calls that hit ``NOSCRIPT`` are re-sent
+        after loading the script; the rest are
+        not repeated.
+        """
+        results = await self._pipeline(client, calls)
+        missing = [
+            i for i, r in enumerate(results)
+            if isinstance(r, NoScriptError)
+        ]
+        if missing:
+            await client.script_load(self.source)
+            retried = await self._pipeline(
+                client, [calls[i] for i in missing]
+            )
+            for i, r in zip(missing, retried):
+                results[i] = r
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+        return results
+
+    async def _pipeline(self, client, calls) -> list:
+        async with client.pipeline(transaction=False) as pipe:
+            for keys, args in calls:
+                pipe.evalsha(
+                    self.sha, len(keys), *keys, *args
+                )
+            return await pipe.execute(raise_on_error=False)
+
+
+# Both scripts below check one or more
+# limits and record the request against all
+# of them only if every limit allows it.
+# They return {allowed, remaining,
+# retry_after_ms}, taking the smallest
+# remaining and the longest wait.
+
+# Two fixed-window counters per limit:
+# KEYS[2i-1] this window, KEYS[2i] the
+# previous one. ARGV[3i-2..3i] are the
+# limit, window and time elapsed in this
+# window.
+SLIDING_WINDOW_SCRIPT = """
+local allowed, remaining, wait = 1, math.huge, 0
+for i = 1, #KEYS / 2 do
+    local limit = tonumber(ARGV[3 * i - 2])
+    local window = tonumber(ARGV[3 * i - 1])
+    local elapsed = tonumber(ARGV[3 * i])
+    local curr = tonumber(
+        redis.call('GET', KEYS[2 * i - 1]) or '0')
+    local prev = tonumber(
+        redis.call('GET', KEYS[2 * i]) or '0')
+    local used = prev * (1 - elapsed / window) + curr
+    if used + 1 > limit then
+        local w
+        if curr + 1 > limit then
+            w = (window - elapsed)
+                + window * (1 - (limit - 1) / curr)
+        else
+            w = window * (1 - (limit - 1 - curr) / prev)
+                - elapsed
+        end
+        allowed = 0
+        wait = math.max(wait, w)
+    else
+        remaining = math.min(
+            remaining, math.floor(limit - used - 1))
+    end
+end
+if allowed == 0 then
+    return {0, 0, math.ceil(wait * 1000)}
+end
+for i = 1, #KEYS / 2 do
+    local window = tonumber(ARGV[3 * i - 1])
+    redis.call('INCR', KEYS[2 * i - 1])
+    redis.call('PEXPIRE', KEYS[2 * i - 1],
+        math.ceil(window * 2000))
+end
+return {1, remaining, 0}
+"""
+
+# Theoretical arrival time of the next
+# request, in seconds, as one string key per
+# limit. ARGV[1] is now; ARGV[2i..2i+1] are
+# the limit and window for KEYS[i].
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed, remaining, wait = 1, math.huge, 0
+local tats, ttls = {}, {}
+for i = 1, #KEYS do
+    local limit = tonumber(ARGV[2 * i])
+    local window = tonumber(ARGV[2 * i + 1])
+    local interval = window / limit
+    local tat = tonumber(redis.call('GET', KEYS[i]) or '0')
+    if tat < now then
+        tat = now
+    end
+    local ahead = tat + interval - now
+    if ahead > window + 1e-9 then
+        allowed = 0
+        wait = math.max(wait, ahead - window)
+    else
+        remaining = math.min(remaining,
+            math.floor((window - ahead) / interval + 1e-9))
+    end
+    tats[i] = tat + interval
+    ttls[i] = math.ceil(ahead * 1000)
+end
+if allowed == 0 then
+    return {0, 0, math.ceil(wait * 1000)}
+end
+for i = 1, #KEYS do
+    redis.call('SET', KEYS[i],
+        string.format('%.6f', tats[i]), 'PX', ttls[i])
+end
+return {1, remaining, 0}
+"""
+
+STRATEGIES = ("sliding_window", "gcra", "sliding_log")
+
+_SCRIPTS = {
+    "sliding_window": LuaScript(SLIDING_WINDOW_SCRIPT),
+    "gcra": LuaScript(GCRA_SCRIPT),
+    "sliding_log": LuaScript(SLIDING_LOG_SCRIPT),
+}
+
+
+def _script(strategy: str) -> LuaScript:
+    try:
+        return _SCRIPTS[strategy]
+    except KeyError:
+        raise ValueError(
+            f"Unknown strategy: {strategy!r} "
+            f"(expected one of {STRATEGIES})"
+        ) from None
+
+
+def _call(
+    strategy: str,
+    limits: Sequence[tuple[str, int, float]],
+    now: float,
+) -> tuple[list[str], list]:
+    """Script ``(keys, args)`` checking
+    ``(key, max_requests, window_seconds)``
+    limits together."""
+    keys: list[str] = []
+    args: list = []
+    if strategy == "sliding_window":
+        for key, max_requests, window in limits:
+            index = int(now // window)
+            # Hash tag keeps both counters in
+            # one cluster slot
+            base = "{" + key + "}:sw:"
+            keys += [base + str(index), base + str(index - 1)]
+            args += [max_requests, window, now - index * window]
+    elif strategy == "gcra":
+        args.append(now)
+        for key, max_requests, window in limits:
+            keys.append(key + ":gcra")
+            args += [max_requests, window]
+    else:
+        if len(limits) != 1:
+            raise ValueError(
+                f"{strategy!r} checks one limit per call"
+            )
+        key, max_requests, window = limits[0]
+        keys.append(key)
+        args += [max_requests, window, now]
+    return keys, args
+
+
+def _decision(result) -> Decision:
+    if isinstance(result, list):
+        allowed, remaining, retry_ms = result
+        return Decision(
+            bool(allowed), remaining, retry_ms / 1000
+        )
+    # Listing 3.2's script returns only 0 or 1
+    return Decision(bool(result), 0, 0.0)
+
+
+async def check_rate_limit_decision(
+    user_id: str,
+    max_requests: int = 100,
+    window_seconds: int = 60,
+    client: redis.Redis | None = None,
+    strategy: str = "sliding_window",
+) -> Decision:
+    """Check and record a request, returning
+    the script's full ``Decision``.
+
+    Raises:
+        ValueError: for an unknown strategy
+    """
+    script = _script(strategy)
+    keys, args = _call(
+        strategy,
+        [(KEY_PREFIX + user_id, max_requests, window_seconds)],
+        time.time(),
+    )
+    return _decision(await script(client or _redis, keys, args))
+
+
+async def check_rate_limit(
+    user_id: str,
+    max_requests: int = 100,
+    window_seconds: int = 60,
+    client: redis.Redis | None = None,
+    strategy: str = "sliding_window",
+) -> bool:
+    """Check and record a request.
+
+    Raises:
+        ValueError: for an unknown strategy
+    """
+    decision = await check_rate_limit_decision(
+        user_id, max_requests, window_seconds, client, strategy
+    )
+    return decision.allowed
+
+
+async def check_rate_limit_tiers(
+    limits: Sequence[tuple[str, int, float]],
+    client: redis.Redis | None = None,
+    strategy: str = "sliding_window",
+) -> Decision:
+    """Check one request against every
+    ``(key, max_requests, window_seconds)``
+    in a single script call, recording it
+    only if all of them allow it.
+
+    On Redis Cluster all keys must hash to
+    one slot.
+
+    Raises:
+        ValueError: for an unknown strategy,
+            ``"sliding_log"`` with more than
+            one limit, or a key used twice
+    """
+    if len({key for key, _, _ in limits}) != len(limits):
+        raise ValueError("limits must use distinct keys")
+    script = _script(strategy)
+    keys, args = _call(strategy, limits, time.time())
+    return _decision(
+        await script(client or _redis, keys, args)
+    )
+
+
+async def check_rate_limits(
+    checks: Iterable[tuple[str, int, int]],
+    client: redis.Redis | None = None,
+    strategy: str = "sliding_window",
+) -> list[bool]:
+    """Check and record one request against
+    each ``(key, max_requests,
+    window_seconds)`` in one round trip.
+
+    Keys are used as given, without
+    ``KEY_PREFIX``. Each limit is checked
+    and recorded independently.
+    """
+    script = _script(strategy)
+    now = time.time()
+    results = await script.run_many(
+        client or _redis,
+        [
+            _call(strategy, [check], now)
+            for check in checks
+        ],
+    )
+    return [_decision(r).allowed for r in results]
+
+
+def make_rate_limit_middleware(
+    check: Callable[[str], Awaitable[bool | Decision]],
+):
+    """Listing 3.2's middleware around any
+    ``check(user_id)`` coroutine.
+
+    Rejections are returned as a 429
+    response; raising ``HTTPException`` from
+    HTTP middleware would surface as a 500.
+    When ``check`` returns a ``Decision``,
+    rate-limit headers are set as well.
+    """
+    async def middleware(request: Request, call_next):
+        user = request.state.user_id
+        result = await check(user)
+        if isinstance(result, Decision):
+            allowed = result.allowed
+            headers = rate_limit_headers(result)
+        else:
+            allowed, headers = result, {}
+        if not allowed:
+            return JSONResponse(
+                {"detail": "Rate limit exceeded"},
+                status_code=429,
+                headers=headers,
+            )
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+    return middleware
+
+
+rate_limit_middleware = make_rate_limit_middleware(
+    check_rate_limit_decision
+)
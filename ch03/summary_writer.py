@@ -0,0 +1,234 @@
+"""Streaming, atomic summary output for the event processor.
+
+``json.dump(summary, out, indent=2)`` renders the whole summary through
+the pure-Python encoder and leaves a half-written file if the process
+dies mid-write. ``write_summary`` emits ``per_user`` one entry at a time
+into a large buffer, writes to a temporary file that is renamed into
+place, and can produce compact JSON or NDJSON with ``orjson`` when it
+is installed.
+
+Output formats:
+
+- ``"json"``: byte-identical to ``json.dump(summary, out, indent=2)``
+- ``"compact"``: the same document without whitespace
+- ``"ndjson"``: a header line with the totals, then one
+  ``{"user_id": ..., "count": ..., "types": [...]}`` line per user
+"""
+
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OUTPUT_FORMATS = ("json", "compact", "ndjson")
+
+# C-accelerated string encoder used by
+# json.dumps(ensure_ascii=True)
+_encode_str = json.encoder.encode_basestring_ascii
+_USER_KEYS = ("count", "types")
+
+BUFFER_SIZE = 1 << 20
+
+_TEMP_FLAGS = (
+    os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    | getattr(os, "O_BINARY", 0)
+)
+
+
+def _key_str(key) -> str:
+    """``key`` as the string ``json.dump``
+    writes for a dict key (``42`` ->
+    ``"42"``, ``True`` -> ``"true"``)."""
+    if type(key) is str:
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    raise TypeError(
+        "keys must be str, int, float, bool or None, "
+        f"not {type(key).__name__}"
+    )
+
+
+def _dumps_compact(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _dumps_indented(obj, depth: int) -> str:
+    text = json.dumps(obj, indent=2)
+    return text.replace("\n", "\n" + "  " * depth)
+
+
+def _dumps_user(info: dict) -> str:
+    """``_dumps_indented(info, 2)`` for the
+    usual ``{"count", "types"}`` entry,
+    without the pure-Python indenting
+    encoder."""
+    if type(info) is not dict or tuple(info) != _USER_KEYS:
+        return _dumps_indented(info, 2)
+    count = info["count"]
+    types = info["types"]
+    if (
+        type(count) is not int
+        or type(types) is not list
+        or not all(type(t) is str for t in types)
+    ):
+        return _dumps_indented(info, 2)
+    if types:
+        body = (
+            "[\n        "
+            + ",\n        ".join(map(_encode_str, types))
+            + "\n      ]"
+        )
+    else:
+        body = "[]"
+    return (
+        '{\n      "count": ' + str(count)
+        + ',\n      "types": ' + body
+        + "\n    }"
+    )
+
+
+def _create_temp(path: str) -> tuple[int, str]:
+    """A new file beside ``path``, created
+    with the mode ``open()`` would give it
+    (unlike ``mkstemp``'s 0600)."""
+    directory, name = os.path.split(os.path.abspath(path))
+    while True:
+        tmp = os.path.join(
+            directory, f".{name}.{os.urandom(4).hex()}.tmp"
+        )
+        try:
+            return os.open(tmp, _TEMP_FLAGS, 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+@contextmanager
+def atomic_open(
+    path: str,
+    buffering: int = BUFFER_SIZE,
+) -> Iterator[TextIO]:
+    """Open a temporary file beside ``path``
+    for writing and rename it over ``path``
+    on success.
+
+    Readers see either the old file or the
+    complete new one, never a partial write.
+    A replaced file keeps its mode; a new
+    one gets the mode ``open()`` would give.
+    """
+    fd, tmp = _create_temp(path)
+    try:
+        with open(
+            fd,
+            "w",
+            buffering=buffering,
+            encoding="utf-8",
+        ) as out:
+            yield out
+            out.flush()
+            os.fsync(out.fileno())
+        try:
+            shutil.copymode(path, tmp)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write_json(summary: dict, out: TextIO) -> None:
+    out.write("{")
+    first = True
+    for key, value in summary.items():
+        out.write("\n  " if first else ",\n  ")
+        first = False
+        out.write(json.dumps(key) + ": ")
+        if key != "per_user" or not value:
+            out.write(_dumps_indented(value, 1))
+            continue
+        out.write("{")
+        sep = "\n    "
+        for uid, info in value.items():
+            out.write(sep)
+            out.write(_encode_str(_key_str(uid)) + ": ")
+            out.write(_dumps_user(info))
+            sep = ",\n    "
+        out.write("\n  }")
+    out.write("\n}" if summary else "}")
+
+
+def _write_compact(summary: dict, out: TextIO) -> None:
+    out.write("{")
+    sep = ""
+    for key, value in summary.items():
+        out.write(sep + _dumps_compact(key) + ":")
+        sep = ","
+        if key != "per_user":
+            out.write(_dumps_compact(value))
+            continue
+        out.write("{")
+        inner = ""
+        for uid, info in value.items():
+            out.write(
+                inner
+                + _dumps_compact(_key_str(uid))
+                + ":"
+                + _dumps_compact(info)
+            )
+            inner = ","
+        out.write("}")
+    out.write("}")
+
+
+def _write_ndjson(summary: dict, out: TextIO) -> None:
+    header = {
+        k: v for k, v in summary.items()
+        if k != "per_user"
+    }
+    out.write(_dumps_compact(header) + "\n")
+    for uid, info in summary.get("per_user", {}).items():
+        out.write(
+            _dumps_compact({"user_id": uid, **info})
+            + "\n"
+        )
+
+
+_WRITERS = {
+    "json": _write_json,
+    "compact": _write_compact,
+    "ndjson": _write_ndjson,
+}
+
+
+def write_summary(
+    summary: dict,
+    output_path: str,
+    output_format: str = "json",
+) -> None:
+    """Atomically write ``summary`` to
+    ``output_path`` in ``output_format``.
+
+    Raises:
+        ValueError: if ``output_format`` is
+            unknown
+    """
+    try:
+        writer = _WRITERS[output_format]
+    except KeyError:
+        raise ValueError(
+            f"Unknown output format: "
+            f"{output_format!r} (expected one "
+            f"of {OUTPUT_FORMATS})"
+        ) from None
+    with atomic_open(output_path) as out:
+        writer(summary, out)
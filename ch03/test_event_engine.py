@@ -0,0 +1,745 @@
+import asyncio
+import bz2
+import gzip
+import io
+import json
+import os
+import pytest
+from datetime import datetime, timezone
+from pathlib import Path
+import event_parallel
+from event_async import (
+    PipelineStats,
+    process_events_async,
+)
+from event_columnar import (
+    EventBatch,
+    process_events_columnar,
+)
+from event_incremental import (
+    checkpoint_path,
+    process_events_incremental,
+)
+from event_io import iter_mmap_lines
+from event_parallel import (
+    iter_shard_lines,
+    process_events_parallel,
+)
+from event_sketches import (
+    ApproxAggregate,
+    HyperLogLog,
+    SpaceSaving,
+    process_events_approximate,
+)
+from event_stream import (
+    fold_events,
+    iter_json_events,
+    merge_aggregates,
+    process_events_streaming,
+)
+from listing_3_7_event_processor_final import (
+    parse_timestamp,
+    process_events,
+)
+from summary_writer import write_summary
+from timestamp_fast import (
+    EpochRange,
+    TimestampParser,
+    datetime_to_epoch_us,
+    epoch_us_to_datetime,
+)
+
+START = datetime(
+    2024, 1, 1, tzinfo=timezone.utc
+)
+END = datetime(
+    2024, 12, 31, tzinfo=timezone.utc
+)
+
+EVENTS = [
+    {"timestamp": "2024-06-01",
+     "user_id": "u1", "type": "click"},
+    {"timestamp": "2024-06-02T10:00:00",
+     "user_id": "u2", "type": "view"},
+    {"timestamp": "2023-01-01",
+     "user_id": "u3", "type": "click"},
+    {"timestamp": "not-a-date",
+     "user_id": "u1", "type": "view"},
+    {"timestamp": "2024-07-01 08:30:00+02:00",
+     "user_id": "u1", "type": "view"},
+]
+
+
+def write_json(path: Path, data: dict):
+    """Helper to write test fixtures."""
+    path.write_text(json.dumps(data))
+
+
+def test_matches_listing_3_7(tmp_path):
+    """Streaming summary equals the
+    json.load version, byte for byte."""
+    inp = tmp_path / "in.json"
+    write_json(inp, {
+        "source": {"name": "x", "n": 12345},
+        "events": EVENTS,
+        "trailer": [1, 2.5, None],
+    })
+    out_a = tmp_path / "a.json"
+    out_b = tmp_path / "b.json"
+
+    expected = process_events(
+        str(inp), str(out_a), START, END
+    )
+    result = process_events_streaming(
+        str(inp), str(out_b), START, END
+    )
+    assert result == expected
+    assert out_b.read_text() == out_a.read_text()
+
+
+def test_ndjson_input(tmp_path):
+    """NDJSON input gives the same summary."""
+    inp = tmp_path / "in.ndjson"
+    inp.write_text("".join(
+        json.dumps(e) + "\n" for e in EVENTS
+    ) + "\n")
+    result = process_events_streaming(
+        str(inp), str(tmp_path / "out.json"),
+        START, END, input_format="ndjson",
+    )
+    assert result["total_events"] == 3
+    assert result["skipped_events"] == 1
+    assert result["per_user"]["u1"] == {
+        "count": 2, "types": ["click", "view"]
+    }
+
+
+def test_values_split_across_chunks():
+    """Tokens cut at a chunk boundary are
+    reassembled."""
+    doc = json.dumps({
+        "n": 1234567890,
+        "version": 1.5e3,
+        "scale": -2.25e-12,
+        "events": EVENTS + [{"w": 0.125}],
+        "ok": True,
+    })
+    for chunk_size in range(1, 13):
+        events = list(iter_json_events(
+            io.StringIO(doc), chunk_size=chunk_size
+        ))
+        assert events == EVENTS + [{"w": 0.125}]
+
+
+def test_missing_events_key_raises(
+    tmp_path,
+):
+    inp = tmp_path / "in.json"
+    write_json(inp, {"data": []})
+    with pytest.raises(ValueError):
+        process_events_streaming(
+            str(inp), str(tmp_path / "o.json"),
+            START, END,
+        )
+
+
+def test_events_not_list_raises(tmp_path):
+    inp = tmp_path / "in.json"
+    write_json(inp, {"events": {"a": 1}})
+    with pytest.raises(ValueError):
+        process_events_streaming(
+            str(inp), str(tmp_path / "o.json"),
+            START, END,
+        )
+
+
+def test_bad_json_raises(tmp_path):
+    inp = tmp_path / "in.json"
+    inp.write_text('{"events": [{"a": 1}, {bad')
+    with pytest.raises(json.JSONDecodeError):
+        process_events_streaming(
+            str(inp), str(tmp_path / "o.json"),
+            START, END,
+        )
+
+
+def test_merge_is_associative():
+    """Merging partials in order matches a
+    single pass."""
+    a, b, c = (
+        fold_events(EVENTS[i:i + 2], START, END)
+        for i in (0, 2, 4)
+    )
+    whole = fold_events(EVENTS, START, END)
+    left = merge_aggregates([
+        merge_aggregates([a, b]), c
+    ])
+    right = merge_aggregates([
+        a, merge_aggregates([b, c])
+    ])
+    assert left.to_summary() == whole.to_summary()
+    assert right.to_summary() == whole.to_summary()
+
+
+def test_parallel_shards_match_streaming(
+    tmp_path, monkeypatch,
+):
+    """Shard boundaries never drop or
+    double-count a line."""
+    monkeypatch.setattr(
+        event_parallel, "MIN_SHARD_BYTES", 1
+    )
+    inp = tmp_path / "in.ndjson"
+    inp.write_text("".join(
+        json.dumps(e) + "\n" for e in EVENTS * 7
+    ))
+    expected = process_events_streaming(
+        str(inp), str(tmp_path / "a.json"),
+        START, END, input_format="ndjson",
+    )
+    for workers in (1, 3):
+        result = process_events_parallel(
+            str(inp), str(tmp_path / "b.json"),
+            START, END, workers=workers,
+        )
+        assert result == expected
+
+
+TIMESTAMPS = [
+    "2024-06-01", "2024-02-29", "2023-02-29",
+    "2024-13-01", "0001-01-01", "0000-01-01",
+    "2024-06-01 12:00:00", "2024-06-01T12:00:60",
+    "2024-06-01T24:00:00", "2024-06-01T1_:00:00",
+    "2024-06-01x12:00:00", "2024-06-01T23:59:59Z",
+    "2024-06-01T12:00:00z", "2024-06-01 12:00:00Z",
+    "9999-12-31T23:59:59Z",
+    "2024-06-01T12:00:00+02:00",
+    "2024-06-01T12:00:00-05:30",
+    "2024-06-01T12:00:00+24:00",
+    "2024-06-01T12:00:00+0200",
+    "2024-06-01T12:00:00.5", "20240601",
+    "2024-06-01T", "2024-06-01T12", "2024-06-01T12:0",
+    "2024-06-01T12:00", "2024-06-01 12:00", "2024-06-01T12:00:",
+    "\u0662\u0660\u0662\u0664-06-01",
+    " 024-06-01", "not-a-date", "", None, 5,
+]
+
+
+@pytest.mark.parametrize("first", TIMESTAMPS)
+def test_fast_parser_agrees_with_listing(
+    first,
+):
+    """Whatever layout is detected first,
+    the fast parser matches
+    parse_timestamp."""
+    parser = TimestampParser()
+    parser.parse(first)
+    for raw in TIMESTAMPS:
+        expected = parse_timestamp(raw)
+        if expected is not None:
+            expected = datetime_to_epoch_us(
+                expected
+            )
+        assert parser.parse(raw) == expected
+
+
+def test_skip_warnings_aggregated(caplog):
+    """A file of bad rows logs a bounded
+    number of warnings."""
+    parser = TimestampParser(warn_limit=3)
+    for _ in range(100):
+        parser.parse("not-a-date")
+    parser.flush_warnings()
+    assert parser.skipped == 100
+    assert len(caplog.records) == 4
+    assert "97 more" in caplog.records[-1].getMessage()
+
+
+def test_epoch_range_inclusive_bounds():
+    """Bounds are inclusive, as in
+    start_date <= ts <= end_date."""
+    bounds = EpochRange.from_datetimes(
+        START, END
+    )
+    parse = TimestampParser().parse
+    assert parse("2024-01-01") in bounds
+    assert parse("2024-12-31") in bounds
+    assert parse("2024-12-31 00:00:01") not in bounds
+    assert parse("2024-01-01T00:30:00+01:00") not in bounds
+    assert epoch_us_to_datetime(
+        bounds.end_us
+    ) == END
+
+
+def test_epoch_range_rejects_naive():
+    with pytest.raises(TypeError):
+        EpochRange.from_datetimes(
+            datetime(2024, 1, 1), END
+        )
+
+
+def test_columnar_matches_listing_3_7(
+    tmp_path,
+):
+    """Vectorized aggregation and the .npz
+    round trip keep the summary identical."""
+    inp = tmp_path / "in.json"
+    write_json(inp, {"events": EVENTS * 3})
+    expected = process_events(
+        str(inp), str(tmp_path / "a.json"),
+        START, END,
+    )
+    npz = tmp_path / "batch.npz"
+    result = process_events_columnar(
+        str(inp), str(tmp_path / "b.json"),
+        START, END, batch_path=str(npz),
+    )
+    assert result == expected
+    assert list(result["per_user"]) == list(
+        expected["per_user"]
+    )
+    reloaded = process_events_columnar(
+        str(npz), str(tmp_path / "c.json"),
+        START, END, input_format="npz",
+    )
+    assert reloaded == expected
+
+
+def test_columnar_null_and_numeric_ids(tmp_path):
+    """Null fields count under None, and ids
+    keep their type through .npz."""
+    inp = tmp_path / "in.json"
+    write_json(inp, {"events": [
+        {"user_id": None, "timestamp": "2024-06-01",
+         "type": None},
+        {"user_id": 41, "timestamp": "2024-06-01",
+         "type": "a"},
+        {"user_id": "41", "timestamp": "2024-06-02",
+         "type": 7},
+    ]})
+    expected = process_events(
+        str(inp), str(tmp_path / "a.json"),
+        START, END,
+    )
+    npz = tmp_path / "batch.npz"
+    result = process_events_columnar(
+        str(inp), str(tmp_path / "b.json"),
+        START, END, batch_path=str(npz),
+    )
+    assert result == expected
+    reloaded = process_events_columnar(
+        str(npz), str(tmp_path / "c.json"),
+        START, END, input_format="npz",
+    )
+    assert reloaded == expected
+    assert list(reloaded["per_user"]) == [None, 41, "41"]
+
+
+def test_columnar_missing_user_raises():
+    batch = EventBatch.from_events([
+        {"timestamp": "2024-06-01",
+         "type": "click"},
+    ])
+    with pytest.raises(KeyError):
+        batch.aggregate(
+            EpochRange.from_datetimes(START, END)
+        )
+
+
+def test_incremental_resumes_from_checkpoint(
+    tmp_path, caplog,
+):
+    """Appended events are merged into the
+    saved state; a partial last line counts
+    now but is not checkpointed."""
+    inp = tmp_path / "in.ndjson"
+    out = tmp_path / "out.json"
+    lines = [json.dumps(e) + "\n" for e in EVENTS]
+    inp.write_text("".join(lines[:3]))
+    process_events_incremental(
+        str(inp), str(out), START, END
+    )
+
+    with inp.open("a") as f:
+        f.write("".join(lines[3:-1]))
+        f.write(lines[-1].rstrip("\n"))
+    caplog.set_level("INFO")
+    result = process_events_incremental(
+        str(inp), str(out), START, END
+    )
+    assert "resumed" in caplog.text
+    ckpt = json.loads(Path(
+        checkpoint_path(str(out))
+    ).read_text())
+    assert ckpt["offset"] == len(
+        "".join(lines[:-1]).encode()
+    )
+
+    full = tmp_path / "full.ndjson"
+    full.write_text("".join(lines))
+    expected = process_events_streaming(
+        str(full), str(tmp_path / "e.json"),
+        START, END, input_format="ndjson",
+    )
+    assert result == expected
+
+
+def test_incremental_recomputes_after_rewrite(
+    tmp_path,
+):
+    inp = tmp_path / "in.ndjson"
+    out = tmp_path / "out.json"
+    inp.write_text(json.dumps(EVENTS[0]) + "\n")
+    process_events_incremental(
+        str(inp), str(out), START, END
+    )
+    inp.write_text(json.dumps(EVENTS[1]) + "\n")
+    result = process_events_incremental(
+        str(inp), str(out), START, END
+    )
+    assert list(result["per_user"]) == ["u2"]
+
+
+def test_incremental_resume_keeps_numeric_user_ids(
+    tmp_path,
+):
+    """User 1 stays one user across runs,
+    apart from user "1"."""
+    inp = tmp_path / "in.ndjson"
+    out = tmp_path / "out.json"
+    events = [
+        {"user_id": 1, "timestamp": "2024-06-01",
+         "type": "a"},
+        {"user_id": "1", "timestamp": "2024-06-02",
+         "type": "b"},
+    ]
+    inp.write_text(json.dumps(events[0]) + "\n")
+    process_events_incremental(
+        str(inp), str(out), START, END
+    )
+    with inp.open("a") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    result = process_events_incremental(
+        str(inp), str(out), START, END
+    )
+    assert result["unique_users"] == 2
+    assert result["per_user"][1]["count"] == 2
+    assert result["per_user"]["1"]["count"] == 1
+
+
+SUMMARY = {
+    "total_events": 4,
+    "unique_users": 3,
+    "skipped_events": 1,
+    "per_user": {
+        "u1": {"count": 2, "types": ["a", "b"]},
+        "é\"q": {"count": 1, "types": []},
+        "u3": {"count": 1, "types": ["x"],
+               "extra": None},
+        "u4": {"types": ["x"], "count": 1},
+    },
+    "avg_events_per_user": 1.33,
+}
+
+
+@pytest.mark.parametrize("summary", [
+    SUMMARY, {**SUMMARY, "per_user": {}},
+])
+def test_writer_matches_json_dump(
+    tmp_path, summary,
+):
+    out = tmp_path / "out.json"
+    write_summary(summary, str(out))
+    assert out.read_text() == json.dumps(
+        summary, indent=2
+    )
+
+
+def test_writer_compact_and_ndjson(tmp_path):
+    out = tmp_path / "out.json"
+    write_summary(SUMMARY, str(out), "compact")
+    assert json.loads(
+        out.read_text(encoding="utf-8")
+    ) == SUMMARY
+
+    write_summary(SUMMARY, str(out), "ndjson")
+    header, *rows = [
+        json.loads(line) for line in
+        out.read_text(encoding="utf-8").splitlines()
+    ]
+    assert header["unique_users"] == 3
+    assert "per_user" not in header
+    assert rows[0] == {
+        "user_id": "u1", "count": 2,
+        "types": ["a", "b"],
+    }
+
+
+def test_writer_numeric_user_ids(tmp_path):
+    """Non-string ids are written as
+    json.dump writes dict keys."""
+    summary = {"per_user": {
+        42: {"count": 1, "types": ["a"]},
+        1.5: {"count": 1, "types": []},
+        True: {"count": 2, "types": ["b"]},
+        None: {"count": 1, "types": []},
+    }}
+    out = tmp_path / "out.json"
+    write_summary(summary, str(out))
+    assert out.read_text() == json.dumps(summary, indent=2)
+    write_summary(summary, str(out), "compact")
+    assert json.loads(out.read_text()) == json.loads(
+        json.dumps(summary)
+    )
+
+
+def test_numeric_user_ids_match_listing_3_7(tmp_path):
+    inp = tmp_path / "in.json"
+    events = [
+        {**e, "user_id": i % 2 + 41}
+        for i, e in enumerate(EVENTS)
+    ]
+    write_json(inp, {"events": events})
+    out_a = tmp_path / "a.json"
+    out_b = tmp_path / "b.json"
+    process_events(str(inp), str(out_a), START, END)
+    process_events_streaming(str(inp), str(out_b), START, END)
+    assert out_b.read_text() == out_a.read_text()
+
+
+def test_writer_is_atomic(tmp_path):
+    """A failed write leaves the previous
+    summary and no temp files."""
+    out = tmp_path / "out.json"
+    out.write_text("old")
+    with pytest.raises(TypeError):
+        write_summary(
+            {"per_user": {"u": object()}},
+            str(out),
+        )
+    assert out.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [out]
+
+
+@pytest.mark.skipif(
+    os.name != "posix", reason="POSIX modes"
+)
+def test_writer_file_modes(tmp_path):
+    """New files get open()'s mode and
+    replaced files keep theirs."""
+    umask = os.umask(0o022)
+    try:
+        new = tmp_path / "new.json"
+        write_summary({"per_user": {}}, str(new))
+        old = tmp_path / "old.json"
+        old.write_text("old")
+        old.chmod(0o640)
+        write_summary({"per_user": {}}, str(old))
+    finally:
+        os.umask(umask)
+    assert new.stat().st_mode & 0o777 == 0o644
+    assert old.stat().st_mode & 0o777 == 0o640
+
+
+def test_hyperloglog_within_error_bound():
+    hll = HyperLogLog(precision=12)
+    for i in range(20000):
+        hll.add(f"user-{i}")
+    error = abs(hll.estimate() - 20000) / 20000
+    assert error < 4 * hll.std_error
+
+
+def test_space_saving_keeps_heavy_hitters():
+    """Items above n/k are always tracked,
+    and counts never underestimate."""
+    sketch = SpaceSaving(k=10)
+    stream = ["hot"] * 300 + ["warm"] * 150
+    stream += [f"cold-{i}" for i in range(500)]
+    for i, item in enumerate(stream):
+        sketch.add(stream[(i * 7919) % len(stream)])
+    top = {item: (c, e) for item, c, e in sketch.top()}
+    assert top["hot"][0] >= 300
+    assert top["hot"][0] - top["hot"][1] <= 300
+    assert "warm" in top
+
+
+def test_approximate_summary(tmp_path):
+    inp = tmp_path / "in.json"
+    write_json(inp, {"events": EVENTS * 4})
+    result = process_events_approximate(
+        str(inp), str(tmp_path / "out.json"),
+        START, END, top_k=10, max_types=1,
+    )
+    assert result["total_events"] == 12
+    assert result["skipped_events"] == 4
+    assert result["unique_users"] == 2
+    u1 = result["top_users"][0]
+    assert (u1["user_id"], u1["count"]) == ("u1", 8)
+    assert u1["max_overcount"] == 0
+    assert len(u1["types"]) == 1
+    assert u1["types_truncated"]
+    assert "approximation" in result
+
+
+def test_approximate_mixed_type_user_ids():
+    """Integer ids from Listing 3.7 input,
+    mixed with strings, in a full sketch."""
+    agg = ApproxAggregate(top_k=3)
+    for uid in [42] * 8 + [42, "42", 7, "u1", None, 1.5] * 2:
+        agg.add({"user_id": uid, "type": "click"})
+    top = {u["user_id"]: u["count"]
+           for u in agg.to_summary()["top_users"]}
+    assert top[42] >= 10
+    other = ApproxAggregate(top_k=3)
+    other.add({"user_id": 7, "type": "view"})
+    assert agg.merge(other).to_summary()["total_events"] == 21
+    hll = HyperLogLog()
+    for uid in [42, "42", 7, None]:
+        hll.add(uid)
+    assert hll.estimate() == 4
+
+
+def test_approximate_merge():
+    a = fold_events(
+        EVENTS[:2], START, END, ApproxAggregate(top_k=2)
+    )
+    b = fold_events(
+        EVENTS[2:], START, END, ApproxAggregate(top_k=2)
+    )
+    merged = a.merge(b).to_summary()
+    assert merged["total_events"] == 3
+    assert merged["unique_users"] == 2
+    assert {u["user_id"] for u in merged["top_users"]} == {
+        "u1", "u2"
+    }
+
+
+def test_async_pipeline_matches_streaming(
+    tmp_path,
+):
+    """Chunks split mid-line still produce
+    the streaming summary."""
+    data = "".join(
+        json.dumps(e) + "\n" for e in EVENTS * 5
+    ).encode()
+    inp = tmp_path / "in.ndjson"
+    inp.write_bytes(data)
+    expected = process_events_streaming(
+        str(inp), str(tmp_path / "a.json"),
+        START, END, input_format="ndjson",
+    )
+
+    async def chunks():
+        for i in range(0, len(data), 7):
+            yield data[i:i + 7]
+
+    stats = PipelineStats()
+    result = asyncio.run(process_events_async(
+        chunks(), str(tmp_path / "b.json"),
+        START, END, batch_size=4, queue_size=2,
+        parser_tasks=2, filter_tasks=3,
+        stats=stats,
+    ))
+    assert result == expected
+    assert stats.stages["parser"].items_in == 25
+    assert stats.stages["filter"].items_out == 15
+
+
+def test_async_pipeline_propagates_errors(
+    tmp_path,
+):
+    async def chunks():
+        yield b'{"timestamp": "2024-06-01"}\n{bad\n'
+
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(process_events_async(
+            chunks(), str(tmp_path / "o.json"),
+            START, END,
+        ))
+
+
+@pytest.mark.parametrize("option", [
+    "queue_size", "batch_size",
+    "parser_tasks", "filter_tasks",
+])
+def test_async_pipeline_rejects_zero_sizes(
+    tmp_path, option,
+):
+    """Zero would hang, drop events or
+    remove backpressure."""
+    async def chunks():
+        yield b'{"timestamp": "2024-06-01"}\n'
+
+    with pytest.raises(ValueError, match=option):
+        asyncio.run(process_events_async(
+            chunks(), str(tmp_path / "o.json"),
+            START, END, **{option: 0},
+        ))
+
+
+@pytest.mark.parametrize("suffix, opener", [
+    (".gz", gzip.open),
+    (".bz2", bz2.open),
+])
+def test_compressed_input(
+    tmp_path, suffix, opener,
+):
+    """Compressed NDJSON gives the same
+    summary in every engine."""
+    text = "".join(
+        json.dumps(e) + "\n" for e in EVENTS
+    )
+    plain = tmp_path / "in.ndjson"
+    plain.write_text(text)
+    packed = tmp_path / ("in.ndjson" + suffix)
+    with opener(packed, "wt") as f:
+        f.write(text)
+    expected = process_events_streaming(
+        str(plain), str(tmp_path / "a.json"),
+        START, END, input_format="ndjson",
+    )
+    assert process_events_streaming(
+        str(packed), str(tmp_path / "b.json"),
+        START, END, input_format="ndjson",
+    ) == expected
+    assert process_events_parallel(
+        str(packed), str(tmp_path / "c.json"),
+        START, END, workers=2,
+    ) == expected
+
+
+def test_zstd_input(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    packed = tmp_path / "in.ndjson.zst"
+    packed.write_bytes(
+        zstandard.ZstdCompressor().compress(
+            "".join(
+                json.dumps(e) + "\n" for e in EVENTS
+            ).encode()
+        )
+    )
+    result = process_events_streaming(
+        str(packed), str(tmp_path / "o.json"),
+        START, END, input_format="ndjson",
+    )
+    assert result["total_events"] == 3
+
+
+def test_mmap_lines_match_shard_lines(tmp_path):
+    """Every split point assigns each line to
+    exactly one range, as iter_shard_lines
+    does."""
+    inp = tmp_path / "in.ndjson"
+    inp.write_bytes(b"a\nbb\n\nccc\nd")
+    size = inp.stat().st_size
+    with inp.open("rb") as f:
+        for cut in range(size + 1):
+            ranges = [(0, cut), (cut, size)]
+            assert [
+                list(iter_mmap_lines(str(inp), s, e))
+                for s, e in ranges
+            ] == [
+                list(iter_shard_lines(f, s, e))
+                for s, e in ranges
+            ]
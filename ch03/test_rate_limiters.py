@@ -0,0 +1,848 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+import listing_3_1_rate_limiter_decorator as listing_3_1
+from limiter_algorithms import STRATEGIES, make_algorithm
+from limiter_sharded import ShardedStore
+from limiter_ring import RingBufferLimiter
+from limiter_store import BoundedStore
+from limiter_tiers import (
+    MultiTierLimiter,
+    RedisTierLimiter,
+    global_limit,
+    per_user,
+    tiered_rate_limit_middleware,
+)
+from bench_rate_limiters import bench_redis, run_suite, zipf_keys
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from redis_fallback import CircuitBreaker, ResilientRateLimiter
+from redis_leasing import (
+    LeasedRateLimiter,
+    leased_rate_limit_middleware,
+)
+from rate_limiter import InMemoryLimiter, rate_limit
+from redis_rate_limiter import (
+    check_rate_limit,
+    check_rate_limit_decision,
+    check_rate_limit_tiers,
+    check_rate_limits,
+    make_client,
+    make_rate_limit_middleware,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def request(user: str = "alice"):
+    return SimpleNamespace(
+        state=SimpleNamespace(user_id=user)
+    )
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_burst_up_to_limit(strategy):
+    clock = FakeClock(1200.0)
+    limiter = InMemoryLimiter(5, 60, strategy, clock)
+    decisions = [limiter.hit("u") for _ in range(6)]
+    assert [d.allowed for d in decisions] == [
+        True] * 5 + [False]
+    assert [d.remaining for d in decisions[:5]] == [
+        4, 3, 2, 1, 0]
+    assert decisions[-1].retry_after > 0
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_retry_after_is_exact(strategy):
+    """Waiting ``retry_after`` is enough;
+    waiting noticeably less is not."""
+    algo = make_algorithm(strategy, 4, 10)
+    rng = random.Random(7)
+    state, now = None, 500.0
+    checked = 0
+    for _ in range(400):
+        now += rng.expovariate(1.0)
+        decision = algo.check(state, now)
+        if decision.allowed:
+            state = decision.state
+            continue
+        wait = decision.retry_after
+        if wait > 0.01:
+            assert not algo.check(
+                state, now + wait - 0.01
+            ).allowed
+        assert algo.check(
+            state, now + wait + 1e-6
+        ).allowed
+        checked += 1
+    assert checked > 20
+
+
+@pytest.mark.parametrize(
+    "strategy", ["sliding_window", "gcra", "token_bucket"]
+)
+def test_state_is_constant_size(strategy):
+    clock = FakeClock()
+    limiter = InMemoryLimiter(100, 60, strategy, clock)
+    for _ in range(1000):
+        limiter.hit("u")
+        clock.advance(0.01)
+    state = limiter.store.get("u", clock.now)
+    assert isinstance(state, (float, tuple))
+    assert isinstance(state, float) or len(state) <= 3
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_idle_state_is_forgettable(strategy):
+    """After ``idle_at`` the stored state
+    decides exactly like no state."""
+    algo = make_algorithm(strategy, 3, 5)
+    rng = random.Random(3)
+    state, now = None, 100.0
+    for _ in range(50):
+        now += rng.random()
+        decision = algo.check(state, now)
+        if decision.allowed:
+            state = decision.state
+    later = max(algo.idle_at(state), now)
+    fresh = algo.check(None, later)
+    kept = algo.check(state, later)
+    assert (kept.allowed, kept.remaining) == (
+        fresh.allowed, fresh.remaining
+    )
+
+
+def test_sliding_log_matches_listing_3_1(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    monkeypatch.setattr(
+        listing_3_1, "_hits", defaultdict(list)
+    )
+
+    @listing_3_1.rate_limit(max_requests=3, window_seconds=2)
+    async def original(request):
+        return "ok"
+
+    @rate_limit(limiter=InMemoryLimiter(
+        3, 2, "sliding_log", clock
+    ))
+    async def ported(request):
+        return "ok"
+
+    async def outcome(endpoint, req):
+        try:
+            return await endpoint(req)
+        except HTTPException as e:
+            return e.status_code
+
+    rng = random.Random(11)
+    for _ in range(300):
+        clock.advance(rng.choice([0, 0.1, 0.5, 1.0, 2.0]))
+        req = request(rng.choice("ab"))
+        assert asyncio.run(
+            outcome(original, req)
+        ) == asyncio.run(outcome(ported, req))
+
+
+def test_decorator_raises_429():
+    limiter = InMemoryLimiter(2, 60, "gcra", FakeClock())
+
+    @rate_limit(limiter=limiter)
+    async def endpoint(request):
+        return {"users": []}
+
+    for _ in range(2):
+        assert asyncio.run(endpoint(request())) == {
+            "users": []}
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(endpoint(request()))
+    assert e.value.status_code == 429
+    assert e.value.detail == "Rate limit exceeded"
+    assert e.value.headers == {
+        "X-RateLimit-Remaining": "0",
+        "Retry-After": "30",
+    }
+    assert asyncio.run(endpoint(request("bob")))
+    assert endpoint.limiter is limiter
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError, match="strategy"):
+        rate_limit(strategy="leaky")
+    with pytest.raises(ValueError, match="positive"):
+        make_algorithm("gcra", 0, 60)
+
+
+def test_store_evicts_least_recently_used():
+    clock = FakeClock()
+    limiter = InMemoryLimiter(
+        5, 60, clock=clock, max_keys=3
+    )
+    for user in "abcd":
+        limiter.hit(user)
+        clock.advance(1)
+    limiter.hit("b")
+    limiter.hit("e")
+    assert len(limiter.store) == 3
+    assert limiter.store.get("a", clock.now) is None
+    assert limiter.store.get("c", clock.now) is None
+    assert limiter.store.get("b", clock.now) is not None
+    assert limiter.store.stats.as_dict() == {
+        "resident_keys": 3,
+        "evictions": 2,
+        "expirations": 0,
+    }
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_store_expires_idle_keys(strategy):
+    """Idle users are swept as traffic from
+    other users arrives, without a full
+    scan."""
+    clock = FakeClock()
+    limiter = InMemoryLimiter(3, 10, strategy, clock)
+    for i in range(100):
+        limiter.hit(f"old{i}")
+    clock.advance(30)
+    for i in range(20):
+        limiter.hit(f"new{i}")
+    stats = limiter.store.stats
+    assert stats.resident_keys == 20
+    assert stats.expirations == 100
+    assert stats.evictions == 0
+
+
+def test_store_sweep_and_lazy_expiry():
+    store = BoundedStore(sweep_batch=0)
+    store.set("a", 1, idle_at=5, now=0)
+    store.set("b", 2, idle_at=50, now=0)
+    store.set("c", 3, idle_at=7, now=0)
+    assert store.get("a", 6) is None
+    assert store.sweep(now=10) == 1
+    assert store.get("b", 10) == 2
+    assert store.stats.as_dict() == {
+        "resident_keys": 1,
+        "evictions": 0,
+        "expirations": 2,
+    }
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_sharded_store_is_thread_safe(strategy):
+    """Concurrent checks on shared keys never
+    admit more than the limit."""
+    limiter = InMemoryLimiter(
+        50, 60, strategy, FakeClock(),
+        store=ShardedStore(shards=4),
+    )
+    allowed = []
+    barrier = threading.Barrier(8)
+
+    def work():
+        barrier.wait()
+        count = sum(
+            limiter.hit(f"user{i % 3}").allowed
+            for i in range(300)
+        )
+        allowed.append(count)
+
+    threads = [
+        threading.Thread(target=work) for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(allowed) == 3 * 50
+
+
+def test_sharded_store_stats_and_sweep():
+    clock = FakeClock()
+    store = ShardedStore(shards=8, max_keys=80)
+    limiter = InMemoryLimiter(
+        5, 10, clock=clock, store=store
+    )
+    for i in range(200):
+        limiter.hit(f"user{i}")
+    assert 0 < len(store) <= 80
+    assert sum(
+        len(shard) > 0 for shard in store._shards
+    ) == 8
+    clock.advance(30)
+    resident = len(store)
+    assert store.sweep(clock.now) == resident
+    stats = store.stats
+    assert stats.resident_keys == 0
+    assert stats.evictions == 200 - resident
+
+
+@pytest.mark.parametrize("strategy", ["sliding_window", "gcra"])
+def test_redis_scripts_match_in_memory(monkeypatch, strategy):
+    """The Lua scripts decide exactly like
+    the Python algorithms."""
+    clock = FakeClock(1_760_000_000.0)
+    monkeypatch.setattr(time, "time", clock)
+    algo = make_algorithm(strategy, 5, 10)
+    rng = random.Random(5)
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        state = None
+        for _ in range(300):
+            clock.advance(rng.choice([0, 0.25, 0.5, 1, 3]))
+            expected = algo.check(state, clock.now)
+            if expected.allowed:
+                state = expected.state
+            assert await check_rate_limit(
+                "u", 5, 10, client, strategy
+            ) == expected.allowed
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(
+    "strategy, max_keys",
+    [("sliding_window", 2), ("gcra", 1)],
+)
+def test_redis_scripts_use_constant_memory(strategy, max_keys):
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        for _ in range(500):
+            await check_rate_limit(
+                "u", 1000, 60, client, strategy
+            )
+        keys = await client.keys("*")
+        types = {await client.type(k) for k in keys}
+        return keys, types
+
+    keys, types = asyncio.run(scenario())
+    assert 1 <= len(keys) <= max_keys
+    assert types == {b"string"}
+
+
+def test_redis_unknown_strategy():
+    with pytest.raises(ValueError, match="strategy"):
+        asyncio.run(check_rate_limit(
+            "u", client=fakeredis.FakeAsyncRedis(),
+            strategy="leaky",
+        ))
+
+
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    """Records the name of every command
+    sent."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = []
+
+    async def execute_command(self, *args, **options):
+        self.commands.append(args[0])
+        return await super().execute_command(
+            *args, **options
+        )
+
+
+def test_redis_check_uses_evalsha():
+    async def scenario():
+        client = CountingRedis()
+        results = [
+            await check_rate_limit("u", 3, 60, client)
+            for _ in range(4)
+        ]
+        await client.script_flush()
+        results.append(
+            await check_rate_limit("v", 3, 60, client)
+        )
+        return results, client.commands
+
+    results, commands = asyncio.run(scenario())
+    assert results == [True, True, True, False, True]
+    assert "EVAL" not in commands
+    assert commands.count("SCRIPT LOAD") == 2
+
+
+def test_redis_batch_is_one_round_trip():
+    async def scenario():
+        client = CountingRedis()
+        checks = [("a", 1, 60), ("b", 2, 60), ("c", 1, 60)]
+        first = await check_rate_limits(checks, client)
+        await client.script_flush()
+        second = await check_rate_limits(checks, client)
+        return first, second, client.commands
+
+    first, second, commands = asyncio.run(scenario())
+    assert first == [True, True, True]
+    assert second == [False, True, False]
+    # Checks travel in pipelines, not as
+    # separate commands
+    assert commands == [
+        "SCRIPT LOAD", "SCRIPT FLUSH", "SCRIPT LOAD"
+    ]
+
+
+def test_leases_never_exceed_shared_limit():
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        clock = FakeClock()
+        instances = [
+            LeasedRateLimiter(
+                client, 50, 60, lease_size=8, clock=clock
+            )
+            for _ in range(3)
+        ]
+        allowed = 0
+        for i in range(300):
+            allowed += await instances[i % 3].check("u")
+        return allowed, instances
+
+    allowed, instances = asyncio.run(scenario())
+    # Up to lease_size - 1 tokens stranded in
+    # each of the other two instances
+    assert 50 - 2 * 7 <= allowed <= 50
+    stats = instances[0].stats
+    assert stats.checks == 100
+    assert stats.round_trips < 10
+    assert stats.hit_rate > 0.9
+
+
+def test_lease_returns_unused_tokens():
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis()
+        clock = FakeClock()
+        a, b = (
+            LeasedRateLimiter(
+                client, 10, 3600, lease_size=10,
+                lease_ttl=5, clock=clock,
+            )
+            for _ in range(2)
+        )
+        assert await a.check("u")
+        blocked = await b.check("u")
+        clock.advance(6)
+        assert await a.release_expired() == 1
+        clock.advance(1)
+        admitted = [await b.check("u") for _ in range(10)]
+        return blocked, admitted, a.stats
+
+    blocked, admitted, stats = asyncio.run(scenario())
+    assert not blocked
+    assert admitted == [True] * 9 + [False]
+    assert stats.tokens_leased == 10
+    assert stats.tokens_returned == 9
+
+
+def test_expired_leases_are_swept_by_new_leases():
+    async def scenario():
+        clock = FakeClock()
+        limiter = LeasedRateLimiter(
+            fakeredis.FakeAsyncRedis(), 10, 3600,
+            lease_size=5, lease_ttl=1, clock=clock,
+        )
+        for i in range(100):
+            await limiter.check(f"old{i}")
+        clock.advance(2)
+        for i in range(20):
+            await limiter.check(f"new{i}")
+        return len(limiter._leases), limiter.stats
+
+    resident, stats = asyncio.run(scenario())
+    # 20 new leases sweep up to 8 old ones each
+    assert resident == 20
+    assert stats.tokens_returned == 100 * 4
+
+
+def test_concurrent_checks_share_one_lease():
+    async def scenario():
+        limiter = LeasedRateLimiter(
+            fakeredis.FakeAsyncRedis(),
+            100, 60, lease_size=10, clock=FakeClock(),
+        )
+        results = await asyncio.gather(
+            *(limiter.check("u") for _ in range(25))
+        )
+        await limiter.close()
+        return results, limiter.stats
+
+    results, stats = asyncio.run(scenario())
+    assert all(results)
+    # Three leases plus the final release
+    assert stats.round_trips == 4
+    assert stats.tokens_returned == 5
+
+
+class FlakyRedis(fakeredis.FakeAsyncRedis):
+    """Raises connection errors while
+    ``down`` is set."""
+
+    down = False
+
+    async def execute_command(self, *args, **options):
+        if self.down:
+            raise RedisConnectionError("Redis is down")
+        return await super().execute_command(
+            *args, **options
+        )
+
+
+@pytest.mark.parametrize(
+    "fallback, expected",
+    [
+        ("memory", [True, True, False]),
+        ("open", [True, True, True]),
+        ("closed", [False, False, False]),
+    ],
+)
+def test_fallback_while_redis_is_down(
+    caplog, fallback, expected
+):
+    clock = FakeClock()
+    breaker = CircuitBreaker(2, 5.0, clock)
+    switches = []
+    breaker.listeners.append(
+        lambda old, new: switches.append(new)
+    )
+
+    async def scenario():
+        client = FlakyRedis()
+        limiter = ResilientRateLimiter(
+            client, 2, 60, "gcra", fallback, breaker
+        )
+        client.down = True
+        results = [
+            await limiter.check("u") for _ in range(3)
+        ]
+        mode = limiter.mode
+        client.down = False
+        clock.advance(5)
+        probe = await limiter.check("v")
+        return results, mode, probe, limiter
+
+    results, mode, probe, limiter = asyncio.run(scenario())
+    assert results == expected
+    assert mode == "fallback"
+    assert probe is True
+    assert limiter.mode == "redis"
+    assert switches == ["open", "half_open", "closed"]
+    assert limiter.stats.as_dict() == {
+        "redis_checks": 1,
+        "fallback_checks": 3,
+        "redis_errors": 2,
+        "mode_switches": 3,
+    }
+    assert "closed -> open" in caplog.text
+
+
+def test_failed_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(1, 5.0, clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.advance(5)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.advance(4)
+    assert not breaker.allow()
+
+
+def test_cancelled_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(1, 5.0, clock)
+
+    class HangingRedis(FlakyRedis):
+        hang = False
+
+        async def execute_command(self, *args, **options):
+            if self.hang:
+                await asyncio.sleep(3600)
+            return await super().execute_command(
+                *args, **options
+            )
+
+    async def scenario():
+        client = HangingRedis()
+        limiter = ResilientRateLimiter(
+            client, 2, 60, "gcra", "memory", breaker
+        )
+        breaker.record_failure()
+        clock.advance(5)
+        client.hang = True
+        probe = asyncio.ensure_future(limiter.check("u"))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        state = breaker.state
+        client.hang = False
+        clock.advance(5)
+        return state, await limiter.check("u")
+
+    state, allowed = asyncio.run(scenario())
+    assert state == "open"
+    assert allowed and breaker.state == "closed"
+
+
+def test_lost_probe_is_retried_after_reset_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(1, 5.0, clock)
+    breaker.record_failure()
+    clock.advance(5)
+    assert breaker.allow()
+    assert not breaker.allow()
+    clock.advance(5)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_make_client_bounds_pool_and_timeouts():
+    client = make_client(
+        max_connections=7, command_timeout=0.02
+    )
+    pool = client.connection_pool
+    assert pool.max_connections == 7
+    assert pool.timeout == 0.1
+    assert pool.connection_kwargs["socket_timeout"] == 0.02
+
+
+def middleware_app(middleware) -> TestClient:
+    app = FastAPI()
+    app.middleware("http")(middleware)
+
+    @app.middleware("http")
+    async def identify(request, call_next):
+        request.state.user_id = request.headers["x-user"]
+        return await call_next(request)
+
+    @app.get("/users")
+    async def get_users():
+        return {"users": []}
+
+    return TestClient(app)
+
+
+def tiered_app(limiter) -> TestClient:
+    return middleware_app(tiered_rate_limit_middleware(limiter))
+
+
+def test_redis_middleware_answers_429_with_headers():
+    fake = fakeredis.FakeAsyncRedis()
+    client = middleware_app(make_rate_limit_middleware(
+        lambda user: check_rate_limit_decision(user, 2, 60, fake)
+    ))
+    responses = [
+        client.get("/users", headers={"x-user": "a"})
+        for _ in range(3)
+    ]
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert [
+        r.headers["X-RateLimit-Remaining"] for r in responses
+    ] == ["1", "0", "0"]
+    assert int(responses[2].headers["Retry-After"]) > 0
+    assert responses[2].json() == {"detail": "Rate limit exceeded"}
+
+
+def test_leased_middleware_answers_429():
+    limiter = LeasedRateLimiter(
+        fakeredis.FakeAsyncRedis(), 2, 60, lease_size=1
+    )
+    client = middleware_app(leased_rate_limit_middleware(limiter))
+    statuses = [
+        client.get("/users", headers={"x-user": "a"}).status_code
+        for _ in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+
+def tiered_limiters():
+    tiers = [per_user(3, 60), global_limit(5, 60)]
+    yield MultiTierLimiter(tiers, "gcra", FakeClock())
+    for strategy in ("gcra", "sliding_window"):
+        yield RedisTierLimiter(
+            tiers, fakeredis.FakeAsyncRedis(), strategy
+        )
+
+
+@pytest.mark.parametrize(
+    "limiter", list(tiered_limiters()),
+    ids=["memory", "redis-gcra", "redis-sliding-window"],
+)
+def test_tiers_checked_in_one_pass(limiter):
+    client = tiered_app(limiter)
+
+    def get(user):
+        return client.get("/users", headers={"x-user": user})
+
+    a = [get("a") for _ in range(4)]
+    assert [r.status_code for r in a] == [200] * 3 + [429]
+    assert [
+        r.headers["X-RateLimit-Remaining"] for r in a
+    ] == ["2", "1", "0", "0"]
+    assert int(a[3].headers["Retry-After"]) > 0
+    assert a[3].json() == {"detail": "Rate limit exceeded"}
+    # a's rejected request did not use up the
+    # global tier, so b gets the last two
+    b = [get("b") for _ in range(3)]
+    assert [r.status_code for r in b] == [200, 200, 429]
+    assert b[1].headers["X-RateLimit-Remaining"] == "0"
+    assert "Retry-After" not in b[1].headers
+
+
+def test_burst_and_sustained_tiers_on_one_key():
+    clock = FakeClock()
+    limiter = MultiTierLimiter(
+        [per_user(2, 1), per_user(5, 3600)], "gcra", clock
+    )
+    req = request("a")
+    allowed = 0
+    for _ in range(20):
+        allowed += limiter.check(req).allowed
+        clock.advance(1)
+    assert allowed == 5
+    with pytest.raises(ValueError, match="distinct keys"):
+        limiter.hit(["k", "k"])
+
+
+@pytest.mark.parametrize("strategy", ["gcra", "sliding_window"])
+def test_redis_burst_and_sustained_tiers(strategy):
+    limiter = RedisTierLimiter(
+        [per_user(2, 1), per_user(5, 3600)],
+        fakeredis.FakeAsyncRedis(),
+        strategy,
+    )
+    req = request("a")
+
+    async def run():
+        return [await limiter.check(req) for _ in range(4)]
+
+    decisions = asyncio.run(run())
+    assert [d.allowed for d in decisions] == [True] * 2 + [False] * 2
+    assert decisions[1].remaining == 0
+    with pytest.raises(ValueError, match="distinct keys"):
+        asyncio.run(check_rate_limit_tiers(
+            [("k", 2, 1), ("k", 5, 3600)],
+            fakeredis.FakeAsyncRedis(),
+        ))
+
+
+def test_zipf_keys_are_skewed():
+    keys = zipf_keys(100, 1.2, 5000, seed=1)
+    assert keys == zipf_keys(100, 1.2, 5000, seed=1)
+    counts = sorted(
+        (keys.count(k) for k in set(keys)), reverse=True
+    )
+    assert counts[0] > 10 * counts[len(counts) // 2]
+    assert len(set(zipf_keys(5, 0, 1000))) == 5
+
+
+def test_benchmark_suite_report():
+    report = asyncio.run(run_suite(
+        ["memory", "redis"], ["gcra", "sliding_log"],
+        users=20, skew=1.0, requests=300,
+        concurrency=4, memory_users=5,
+    ))
+    json.dumps(report)
+    assert report["config"]["redis"] == "fakeredis"
+    results = report["results"]
+    assert [(r["backend"], r["strategy"]) for r in results] == [
+        ("memory", "gcra"),
+        ("memory", "sliding_log"),
+        ("redis", "gcra"),
+        ("redis", "sliding_log"),
+    ]
+    for r in results:
+        assert r["throughput_rps"] > 0
+        assert r["p50_us"] <= r["p99_us"] <= r["p999_us"]
+    gcra, log = results[0], results[1]
+    assert gcra["bytes_per_user"] < log["bytes_per_user"]
+    assert results[2]["keys_per_user"] == 1
+
+
+def test_redis_benchmark_leaves_other_keys_alone():
+    client = fakeredis.FakeAsyncRedis()
+
+    async def run():
+        await client.set("app:session", "1")
+        await check_rate_limit("alice", 5, 60, client)
+        result = await bench_redis(
+            client, "sliding_window", ["user1", "user2"] * 3, 2
+        )
+        return result, sorted(await client.keys("*"))
+
+    result, keys = asyncio.run(run())
+    assert result["keys_per_user"] == 1
+    assert len(keys) == 2 and b"app:session" in keys
+
+
+def test_ring_buffer_matches_sliding_log():
+    clock = FakeClock()
+    ring = RingBufferLimiter(4, 3, max_keys=8, clock=clock)
+    log = InMemoryLimiter(4, 3, "sliding_log", clock)
+    rng = random.Random(2)
+    for _ in range(2000):
+        clock.advance(rng.choice([0, 0.05, 0.3, 1, 2.5]))
+        user = rng.choice("abcde")
+        got, want = ring.hit(user), log.hit(user)
+        assert got.allowed == want.allowed
+        assert got.remaining == want.remaining
+        assert got.retry_after == pytest.approx(
+            want.retry_after
+        )
+
+
+def test_ring_buffer_reuses_slots():
+    clock = FakeClock()
+    ring = RingBufferLimiter(2, 10, max_keys=2, clock=clock)
+    block = ring._times
+    ring.hit("a")
+    ring.hit("b")
+    clock.advance(11)
+    ring.hit("c")
+    assert ring.hit("c").allowed
+    assert not ring.hit("c").allowed
+    ring.hit("d")
+    assert ring._times is block
+    assert len(block) == 4
+    assert len(ring._heads) == 2
+    assert ring.stats.as_dict() == {
+        "resident_keys": 2,
+        "evictions": 0,
+        "expirations": 2,
+    }
+    clock.advance(11)
+    assert ring.sweep(clock.now) == 2
+    assert len(ring) == 0
+
+
+def test_ring_buffer_with_decorator():
+    ring = RingBufferLimiter(1, 60, clock=FakeClock())
+
+    @rate_limit(limiter=ring)
+    async def endpoint(request):
+        return "ok"
+
+    assert asyncio.run(endpoint(request())) == "ok"
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(endpoint(request()))
+    assert e.value.headers["Retry-After"] == "60"